@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import re
+import time
+from collections.abc import Iterator
+from functools import lru_cache
+from typing import Any
+
+# Frammenti di nome campo che indicano dati personali (confronto case-insensitive su sottostringa).
+DEFAULT_PERSONAL_MARKERS = (
+    "name",
+    "email",
+    "phone",
+    "mobile",
+    "address",
+    "street",
+    "city",
+    "zip",
+    "postal",
+    "ssn",
+    "fiscal",
+    "vat",
+    "tax",
+    "birth",
+    "dob",
+    "password",
+    "token",
+)
+
+MASK = "***"
+# Oltre questa soglia la memo delle decisioni viene svuotata (chiavi generate dinamicamente).
+_MAX_MEMO_KEYS = 100_000
+
+
+class Anonymizer:
+    """Motore di anonimizzazione con regole compilate una sola volta.
+
+    - chiavi: un'unica regex con tutti i marker e i pattern configurati, con memo delle decisioni;
+    - valori: regex opzionali (es. email, IBAN) che mascherano le stringhe anche sotto chiavi neutre;
+    - visita iterativa: nessun limite di ricorsione sui documenti molto annidati.
+    """
+
+    def __init__(
+        self,
+        extra_markers: tuple[str, ...] = (),
+        key_patterns: tuple[str, ...] = (),
+        value_patterns: tuple[str, ...] = (),
+        allowed_keys: tuple[str, ...] = (),
+    ) -> None:
+        alternatives = [re.escape(marker) for marker in (*DEFAULT_PERSONAL_MARKERS, *extra_markers)]
+        alternatives.extend(f"(?:{pattern})" for pattern in key_patterns)
+        self._key_matcher = re.compile("|".join(alternatives), re.IGNORECASE)
+        self._value_matcher = (
+            re.compile("|".join(f"(?:{pattern})" for pattern in value_patterns)) if value_patterns else None
+        )
+        self._allowed = frozenset(key.lower() for key in allowed_keys)
+        self._decisions: dict[str, bool] = {}
+
+    def is_personal_key(self, key: str) -> bool:
+        decision = self._decisions.get(key)
+        if decision is None:
+            lowered = key.lower()
+            decision = lowered not in self._allowed and self._key_matcher.search(lowered) is not None
+            if len(self._decisions) >= _MAX_MEMO_KEYS:
+                self._decisions.clear()
+            self._decisions[key] = decision
+        return decision
+
+    def is_personal_value(self, value: Any) -> bool:
+        if self._value_matcher is None or not isinstance(value, str):
+            return False
+        return self._value_matcher.search(value) is not None
+
+    def anonymize(self, document: dict[str, Any]) -> dict[str, Any]:
+        """Copia del documento con i valori personali mascherati (l'originale non viene modificato)."""
+        root: dict[str, Any] = {}
+        # (contenitore sorgente, contenitore destinazione, tutto il sottoalbero è personale)
+        stack: list[tuple[Any, Any, bool]] = [(document, root, False)]
+        while stack:
+            source, target, masked = stack.pop()
+            is_dict = isinstance(source, dict)
+            for key, value in source.items() if is_dict else enumerate(source):
+                hide = masked or (is_dict and isinstance(key, str) and self.is_personal_key(key))
+                if isinstance(value, dict):
+                    child: Any = {}
+                    stack.append((value, child, hide))
+                elif isinstance(value, list):
+                    child = []
+                    stack.append((value, child, hide))
+                elif hide:
+                    child = self._mask_leaf(value)
+                elif self.is_personal_value(value):
+                    child = MASK
+                else:
+                    child = value
+                if is_dict:
+                    target[key] = child
+                else:
+                    target.append(child)
+        return root
+
+    @staticmethod
+    def _mask_leaf(value: Any) -> Any:
+        # Si conservano null e booleani; numeri azzerati; tutto il resto diventa "***".
+        if value is None or isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)):
+            return 0
+        return MASK
+
+
+@lru_cache(maxsize=32)
+def get_anonymizer(
+    extra_markers: tuple[str, ...] = (),
+    key_patterns: tuple[str, ...] = (),
+    value_patterns: tuple[str, ...] = (),
+    allowed_keys: tuple[str, ...] = (),
+) -> Anonymizer:
+    """Anonymizer condiviso per insieme di regole: regex e memo sono riusati tra entità e thread."""
+    return Anonymizer(extra_markers, key_patterns, value_patterns, allowed_keys)
+
+
+def benchmark(documents: int = 100_000, fields: int = 12) -> dict[str, float]:
+    """Misura il throughput su documenti sintetici annidati: `python -m datamodel_navigator.anonymization`."""
+    anonymizer = get_anonymizer(value_patterns=(r"[\w.+-]+@[\w-]+\.[\w.]+",))
+    document = {f"field_{i}": i for i in range(fields)}
+    document.update(
+        {
+            "customer_name": "Mario Rossi",
+            "contact": {"email": "mario@example.com", "phone": "123"},
+            "items": [{"sku": "A1", "qty": 2, "note": "scrivere a mario@example.com"}] * 3,
+        }
+    )
+    values = sum(1 for _ in _leaves(document))
+    started = time.perf_counter()
+    for _ in range(documents):
+        anonymizer.anonymize(document)
+    seconds = time.perf_counter() - started
+    return {
+        "documents": documents,
+        "values": documents * values,
+        "seconds": round(seconds, 4),
+        "values_per_second": round(documents * values / seconds) if seconds else 0.0,
+    }
+
+
+def _leaves(document: dict[str, Any]) -> Iterator[Any]:
+    stack: list[Any] = [document]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        else:
+            yield value
+
+
+if __name__ == "__main__":
+    result = benchmark()
+    print(
+        f"{result['documents']} documenti, {result['values']} valori in {result['seconds']} s "
+        f"({result['values_per_second']:,.0f} valori/s)"
+    )
@@ -7,7 +7,7 @@ from dataclasses import asdict
 from pathlib import Path
 
 from datamodel_navigator.curation import add_manual_relationship, auto_cleanup, find_entity, suggest_relationships
-from datamodel_navigator.discovery import MongoConfig, PostgresConfig, discover_model
+from datamodel_navigator.discovery import DiscoveryOptions, MongoConfig, PostgresConfig, discover_model
 from datamodel_navigator.io_utils import load_model, save_model
 from datamodel_navigator.llm_guidance import LLMConfig, correct_data_model_json
 from datamodel_navigator.viewer import write_viewer
@@ -99,15 +99,18 @@ def phase_discovery() -> None:
                 allow_insecure_ssl=allow_insecure_ssl,
             )
 
+    options = DiscoveryOptions(**(saved_config.get("discovery") or {}))
+
     config_to_save = {
         "postgres": asdict(pg) if pg else None,
         "mongo": asdict(mg) if mg else None,
         "llm": asdict(llm_config) if llm_config else None,
+        "discovery": asdict(options),
     }
     save_config(config_to_save)
     print(f"Configurazione salvata in {DEFAULT_CONFIG}")
 
-    model = discover_model(pg, mg, llm_config=llm_config)
+    model = discover_model(pg, mg, llm_config=llm_config, options=options)
 
     metadata = getattr(model, "metadata", {})
     for step in metadata.get("discovery_log", []):
@@ -119,6 +122,12 @@ def phase_discovery() -> None:
         for line in count_log:
             print(f"- {line}")
 
+    timings = metadata.get("discovery_timings", {})
+    if timings:
+        print("\nEntità più lente da profilare (secondi):")
+        for entity_id, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True)[:5]:
+            print(f"- {entity_id}: {seconds:.3f}s")
+
     save_model(model, DEFAULT_MODEL)
     print(f"Modello scoperto e salvato in {DEFAULT_MODEL}")
 
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from datamodel_navigator.models import DataModel, Entity, Relationship
+from datamodel_navigator.models import Attribute, DataModel, Entity, Relationship
 
 TECHNICAL_NAMES = {
     "created_at",
@@ -17,12 +17,81 @@ def auto_cleanup(model: DataModel) -> None:
         entity.attributes = [a for a in entity.attributes if a.name.lower() not in TECHNICAL_NAMES]
 
 
+def declared_relationships(model: DataModel) -> list[Relationship]:
+    """Converte i riferimenti noti sugli attributi in relazioni.
+
+    Le FK dichiarate (PostgreSQL) sono certe; i riferimenti ObjectId rilevati in discovery hanno
+    come confidence la quota di valori campionati trovata nella collection di destinazione.
+    """
+    entity_ids = {e.id for e in model.entities}
+    existing = {r.id for r in model.relationships}
+    declared: list[Relationship] = []
+    for entity in model.entities:
+        for attr in entity.attributes:
+            if not attr.references:
+                continue
+            to_entity, _, to_field = attr.references.rpartition(".")
+            if to_entity not in entity_ids:
+                continue
+            rel_id = f"rel:{entity.id}:{attr.name}->{to_entity}:{to_field}"
+            if rel_id in existing:
+                continue
+            existing.add(rel_id)
+            hit_ratio = attr.stats.get("reference_hit_ratio")
+            declared.append(
+                Relationship(
+                    id=rel_id,
+                    from_entity=entity.id,
+                    from_field=attr.name,
+                    to_entity=to_entity,
+                    to_field=to_field,
+                    confidence=1.0 if hit_ratio is None else round(hit_ratio, 2),
+                    source="declared" if hit_ratio is None else "detected",
+                )
+            )
+    return declared
+
+
+def indexed_fields(entity: Entity) -> set[str]:
+    """Campi che guidano almeno un indice dell'entità: ricerche per chiave in O(log n)."""
+    return {index["columns"][0] for index in entity.indexes if index.get("columns")}
+
+
+def _score_relationship(
+    base: float,
+    source: Entity,
+    source_attr: Attribute,
+    target: Entity,
+    target_field: str,
+) -> float:
+    """Corregge la confidence euristica con indici e profili statistici (pg_stats) quando disponibili."""
+    score = base
+    target_attr = next((a for a in target.attributes if a.name == target_field), None)
+    if target_attr is not None and (target_attr.primary_key or target_attr.unique):
+        score += 0.1
+    if source_attr.name in indexed_fields(source):
+        # Un campo di riferimento indicizzato è quasi sempre usato nelle join.
+        score += 0.05
+    if source_attr.stats.get("null_frac", 0.0) >= 0.99:
+        # Colonna quasi sempre vuota: difficilmente è una chiave di join usata.
+        score -= 0.3
+    source_distinct = source_attr.stats.get("distinct_estimate")
+    target_distinct = target_attr.stats.get("distinct_estimate") if target_attr is not None else None
+    if source_distinct and target_distinct and source_distinct > target_distinct * 1.1:
+        # Più valori distinti della chiave di destinazione: non può essere un riferimento.
+        score -= 0.3
+    return round(min(max(score, 0.05), 0.95), 2)
+
+
 def suggest_relationships(model: DataModel) -> list[Relationship]:
     suggestions: list[Relationship] = []
     entity_by_name = {e.name.lower(): e for e in model.entities}
 
     for entity in model.entities:
         for attr in entity.attributes:
+            if attr.references:
+                # Join già dichiarata nel database: l'euristica sui nomi non serve.
+                continue
             lowered = attr.name.lower()
             if lowered.endswith("_id") and lowered != "id":
                 target_name = lowered.removesuffix("_id")
@@ -35,7 +104,7 @@ def suggest_relationships(model: DataModel) -> list[Relationship]:
                             from_field=attr.name,
                             to_entity=target.id,
                             to_field="id",
-                            confidence=0.7,
+                            confidence=_score_relationship(0.7, entity, attr, target, "id"),
                             source="auto",
                         )
                     )
@@ -50,7 +119,7 @@ def suggest_relationships(model: DataModel) -> list[Relationship]:
                             from_field=attr.name,
                             to_entity=target.id,
                             to_field="id",
-                            confidence=0.55,
+                            confidence=_score_relationship(0.55, entity, attr, target, "id"),
                             source="auto",
                         )
                     )
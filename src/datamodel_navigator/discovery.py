@@ -1,15 +1,52 @@
 from __future__ import annotations
 
-from collections import Counter
-from dataclasses import dataclass
-from typing import Any
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
 
-from datamodel_navigator.llm_guidance import LLMConfig, analyze_entity_samples, apply_llm_guidance
+from datamodel_navigator.anonymization import MASK, Anonymizer, get_anonymizer
+from datamodel_navigator.curation import declared_relationships, indexed_fields
+from datamodel_navigator.io_utils import load_model
+from datamodel_navigator.llm_guidance import (
+    LLMConfig,
+    RateLimiter,
+    analyze_entity_samples,
+    apply_llm_guidance,
+    reduce_samples,
+)
 from datamodel_navigator.models import Attribute, DataModel, Entity
+from datamodel_navigator.sampling import SampleStore
+from datamodel_navigator.schema_inference import SchemaTrie, ShapeClusterer
+
+
+@dataclass(kw_only=True)
+class SampleConfig:
+    """Opzioni dei campioni comuni a PostgreSQL e MongoDB (solo keyword, dopo i campi della sorgente)."""
+
+    # Regole di anonimizzazione in aggiunta ai marker predefiniti: frammenti e regex sui nomi
+    # campo, regex sui valori (es. email) e campi da non mascherare.
+    personal_key_markers: list[str] = field(default_factory=list)
+    personal_key_patterns: list[str] = field(default_factory=list)
+    personal_value_patterns: list[str] = field(default_factory=list)
+    non_personal_keys: list[str] = field(default_factory=list)
+    # Budget di memoria (MB) per sorgente, condiviso dai campioni delle sue entità: oltre, i campioni
+    # di ogni entità sono scritti in un file JSONL in `sample_spill_dir` man mano che vengono prodotti.
+    # Con PostgreSQL e MongoDB insieme la memoria complessiva può arrivare al doppio del budget.
+    sample_memory_budget_mb: float = 64.0
+    sample_spill_dir: str = "output/samples"
 
 
 @dataclass
-class PostgresConfig:
+class PostgresConfig(SampleConfig):
     host: str = "localhost"
     port: int = 5432
     dbname: str = "postgres"
@@ -17,80 +54,794 @@ class PostgresConfig:
     password: str = "postgres"
     schema: str = "public"
     sample_records: int = 50
+    # Connessioni parallele per count/sample per tabella (1 = discovery seriale su una connessione).
+    pool_size: int = 1
+    # "exact" (COUNT(*)), "estimate" (statistiche di catalogo) o "hybrid" (COUNT(*) solo sotto soglia).
+    count_strategy: str = "exact"
+    exact_count_threshold: int = 100_000
+    # "limit" (prime righe), "system" o "bernoulli" (TABLESAMPLE con percentuale dalla stima righe).
+    sample_method: str = "limit"
+    # Statistiche per colonna da pg_stats (nessuna lettura delle tabelle).
+    column_stats: bool = True
+    # Riprofila solo le tabelle con fingerprint (DDL + contatori di modifica) cambiato rispetto al modello precedente.
+    incremental: bool = False
+    previous_model_path: str = "output/model.json"
+    # Una sola entità per tabella partizionata: conteggi sommati sulle partizioni, campioni da poche di esse.
+    collapse_partitions: bool = True
+    partition_sample_count: int = 3
+    # Struttura delle colonne jsonb (percorsi, tipi, presenza) aggregata lato server su un TABLESAMPLE.
+    jsonb_inference: bool = True
+    jsonb_sample_rows: int = 1000
+    jsonb_max_depth: int = 4
+    # Limiti sul payload dei campioni: testo troncato, binari sostituiti dalla dimensione,
+    # colonne con larghezza media (pg_stats.avg_width) oltre soglia escluse; 0 disattiva il limite.
+    sample_text_max_chars: int = 256
+    sample_value_max_bytes: int = 4096
+    sample_column_max_avg_bytes: int = 2048
+    sample_fetch_size: int = 100
+
+
+COUNT_STRATEGIES = ("exact", "estimate", "hybrid")
+COUNT_STRATEGY_LABELS = {"exact": "conteggio esatto", "estimate": "stima da metadati"}
+SOURCE_PREFIXES = {"postgres": "pg", "mongo": "mg"}
+SAMPLE_METHODS = ("limit", "system", "bernoulli")
+# TABLESAMPLE è ammesso solo su tabelle (anche partizionate) e viste materializzate.
+_TABLESAMPLE_RELKINDS = {"r", "p", "m"}
+# Margine sulla percentuale per compensare la varianza di SYSTEM/BERNOULLI e stime non aggiornate.
+_TABLESAMPLE_OVERSAMPLE = 2.0
+_TEXT_TYPES = {"text", "character varying", "character", "citext"}
+_JSON_TYPES = {"json", "jsonb"}
 
 
 @dataclass
-class MongoConfig:
+class MongoConfig(SampleConfig):
     uri: str = "mongodb://localhost:27017"
     dbname: str = "test"
     sample_size: int = 200
     sample_records: int = 50
+    # "estimate" (collStats/estimated_document_count), "exact" (count_documents) o "hybrid" (esatto sotto soglia).
+    count_strategy: str = "estimate"
+    exact_count_threshold: int = 100_000
+    # Profondità massima dei percorsi annidati (`address.city`, `items[].sku`) nello schema inferito.
+    schema_max_depth: int = 8
+    # Presenza e tipi dei campi di primo livello calcolati con una pipeline di aggregazione:
+    # al client arrivano solo gli aggregati, più i `sample_records` documenti per la deep discovery.
+    server_side_profiling: bool = False
+    # Collection profilate in parallele su un unico MongoClient (pool di connessioni condiviso).
+    concurrency: int = 1
+    # Se true scopre tutti i database del cluster (esclusi admin/local/config) e ignora `dbname`.
+    all_databases: bool = False
+    # Limiti sui campioni della deep discovery: array troncati, stringhe accorciate e BinData sostituiti
+    # da "<binData N bytes>" ("stub") o rimossi ("drop"); lo schema vede array e binari reali. 0 = nessun limite.
+    sample_max_array_items: int = 20
+    sample_max_string_length: int = 256
+    sample_binary: str = "stub"
+    # Riprofila solo le collection con fingerprint ($collStats + hash dello schema salvato) cambiato.
+    incremental: bool = False
+    previous_model_path: str = "output/model.json"
+    # Riferimenti tra collection: per ogni campo ObjectId un $in batch su `_id` delle collection candidate.
+    reference_detection: bool = True
+    reference_probe_size: int = 100
+    reference_min_hit_ratio: float = 0.5
+    # Le sonde sono brevi lookup sull'indice `_id_`: hanno un parallelismo proprio, più alto di `concurrency`.
+    reference_probe_concurrency: int = 8
+    # Varianti strutturali per firma delle chiavi di primo livello, con rilevamento del campo discriminante.
+    variant_detection: bool = True
+    max_variants: int = 10
 
 
-def _infer_type(values: list[Any]) -> str:
-    types = Counter(type(v).__name__ for v in values if v is not None)
-    if not types:
-        return "unknown"
-    return types.most_common(1)[0][0]
-
-
-def _is_personal_key(key: str) -> bool:
-    personal_markers = {
-        "name",
-        "email",
-        "phone",
-        "mobile",
-        "address",
-        "street",
-        "city",
-        "zip",
-        "postal",
-        "ssn",
-        "fiscal",
-        "vat",
-        "tax",
-        "birth",
-        "dob",
-        "password",
-        "token",
-    }
-    lowered = key.lower()
-    return any(marker in lowered for marker in personal_markers)
+def _sample_store(config: SampleConfig, source: str) -> SampleStore:
+    return SampleStore(
+        int(config.sample_memory_budget_mb * 1024 * 1024),
+        Path(config.sample_spill_dir) / source if config.sample_spill_dir else None,
+    )
+
+
+def _anonymizer(config: SampleConfig) -> Anonymizer:
+    return get_anonymizer(
+        tuple(config.personal_key_markers),
+        tuple(config.personal_key_patterns),
+        tuple(config.personal_value_patterns),
+        tuple(config.non_personal_keys),
+    )
+
+
+class DiscoveryCancelled(RuntimeError):
+    """Discovery interrotta perché la deadline delle sorgenti è scaduta."""
+
+
+def _check_cancelled(cancel: threading.Event | None) -> None:
+    # Controllato tra una tabella/collection e l'altra: le query in corso terminano normalmente.
+    if cancel is not None and cancel.is_set():
+        raise DiscoveryCancelled("Discovery interrotta: deadline superata.")
+
+
+def _map_fail_fast(executor: ThreadPoolExecutor, fn: Callable[[Any], Any], items: Iterable[Any]) -> list[Any]:
+    """Come `executor.map`, ma al primo errore annulla i task ancora in coda e lo rilancia subito.
+
+    Senza annullamento l'uscita dal `with ThreadPoolExecutor` eseguirebbe comunque tutte le
+    tabelle/collection rimaste prima di mostrare l'errore.
+    """
+    futures = [executor.submit(fn, item) for item in items]
+    done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+    failed = next((future for future in futures if future in done and future.exception() is not None), None)
+    if failed is not None:
+        for future in futures:
+            future.cancel()
+        raise failed.exception()
+    return [future.result() for future in futures]
+
+
+class _PostgresConnectionPool:
+    """Pool limitato di connessioni, aperte on-demand e condivise dai worker di discovery.
+
+    `initial` è una connessione già aperta (es. quella del catalogo) che conta nel limite `size`:
+    viene usata per prima e non viene chiusa dal pool, che non ne è proprietario.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int, initial: Any = None) -> None:
+        self._connect = connect
+        self._size = max(1, size)
+        self._idle: queue.LifoQueue[Any] = queue.LifoQueue()
+        self._opened: list[Any] = []
+        self._borrowed = 0
+        self._lock = threading.Lock()
+        if initial is not None:
+            self._idle.put(initial)
+            self._borrowed = 1
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _acquire(self) -> Any:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._borrowed + len(self._opened) < self._size:
+                conn = self._connect()
+                self._opened.append(conn)
+                return conn
+        return self._idle.get()
+
+    def close(self) -> None:
+        for conn in self._opened:
+            conn.close()
+        self._opened.clear()
+
+
+def _connect_postgres(psycopg: Any, config: PostgresConfig) -> Any:
+    return psycopg.connect(
+        host=config.host,
+        port=config.port,
+        dbname=config.dbname,
+        user=config.user,
+        password=config.password,
+    )
+
+
+_TABLE_CATALOG_QUERY = """
+SELECT c.relname,
+       c.relkind,
+       c.reltuples,
+       c.relpages,
+       pg_relation_size(c.oid) / current_setting('block_size')::bigint AS current_pages,
+       s.n_live_tup,
+       s.n_tup_ins,
+       s.n_tup_upd,
+       s.n_tup_del,
+       s.last_analyze,
+       s.last_autoanalyze,
+       c.relispartition,
+       (
+           SELECT parent.relname
+           FROM pg_inherits inh
+           JOIN pg_class parent ON parent.oid = inh.inhparent
+           WHERE inh.inhrelid = c.oid
+           LIMIT 1
+       ) AS partition_parent
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+"""
+
+
+# PK, UNIQUE, FK e indici dell'intero schema in un solo round-trip verso pg_catalog.
+_CONSTRAINTS_QUERY = """
+SELECT cls.relname,
+       'constraint' AS kind,
+       con.contype::text AS type,
+       con.conname::text AS name,
+       ARRAY(
+           SELECT a.attname::text
+           FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+           JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+           ORDER BY k.ord
+       ) AS columns,
+       ref_ns.nspname::text AS ref_schema,
+       ref.relname::text AS ref_table,
+       ARRAY(
+           SELECT a.attname::text
+           FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+           JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+           ORDER BY k.ord
+       ) AS ref_columns,
+       NULL::text AS method
+FROM pg_constraint con
+JOIN pg_class cls ON cls.oid = con.conrelid
+JOIN pg_namespace ns ON ns.oid = cls.relnamespace
+LEFT JOIN pg_class ref ON ref.oid = con.confrelid
+LEFT JOIN pg_namespace ref_ns ON ref_ns.oid = ref.relnamespace
+WHERE ns.nspname = %s AND con.contype IN ('p', 'u', 'f')
+  -- Una FK verso una tabella partizionata ha una riga clonata per ogni partizione referenziata:
+  -- si tiene solo quella verso la tabella padre (le FK ereditate dalle partizioni referenzianti restano).
+  AND NOT (con.contype = 'f' AND con.conparentid <> 0 AND COALESCE(ref.relispartition, false))
+UNION ALL
+SELECT tbl.relname,
+       'index' AS kind,
+       CASE WHEN ix.indisprimary THEN 'p' WHEN ix.indisunique THEN 'u' ELSE 'i' END AS type,
+       idx.relname::text AS name,
+       ARRAY(
+           SELECT a.attname::text
+           FROM unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+           JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+           ORDER BY k.ord
+       ) AS columns,
+       NULL::text,
+       NULL::text,
+       NULL::text[],
+       am.amname::text AS method
+FROM pg_index ix
+JOIN pg_class tbl ON tbl.oid = ix.indrelid
+JOIN pg_class idx ON idx.oid = ix.indexrelid
+JOIN pg_am am ON am.oid = idx.relam
+JOIN pg_namespace ns ON ns.oid = tbl.relnamespace
+WHERE ns.nspname = %s
+ORDER BY 1, 2, 4
+"""
+
+
+_MAX_COMMON_VALUES = 10
+_COLUMN_STATS_QUERY = f"""
+SELECT tablename,
+       attname,
+       null_frac,
+       n_distinct,
+       (most_common_vals::text::text[])[1:{_MAX_COMMON_VALUES}] AS most_common_vals,
+       (histogram_bounds::text::text[])[1] AS histogram_min,
+       (histogram_bounds::text::text[])[array_length(histogram_bounds::text::text[], 1)] AS histogram_max,
+       avg_width
+FROM pg_stats
+WHERE schemaname = %s
+ORDER BY inherited
+"""
+
 
+# Percorsi jsonb calcolati in Postgres: solo l'aggregato (percorso, tipo, documenti) attraversa la rete.
+_JSONB_PATHS_QUERY = """
+WITH RECURSIVE sampled AS (
+    SELECT row_number() OVER () AS doc_id, {column} AS doc
+    FROM {table}{tablesample}
+    LIMIT %s
+),
+paths(doc_id, path, value, depth) AS (
+    SELECT s.doc_id, ''::text, s.doc, 0
+    FROM sampled s
+    WHERE s.doc IS NOT NULL
+    UNION ALL
+    SELECT p.doc_id, child.path, child.value, p.depth + 1
+    FROM paths p
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN p.path = '' THEN e.key ELSE p.path || '.' || e.key END AS path, e.value
+        FROM jsonb_each(CASE WHEN jsonb_typeof(p.value) = 'object' THEN p.value ELSE '{{}}'::jsonb END) AS e
+        UNION ALL
+        SELECT p.path || '[]', a.value
+        FROM jsonb_array_elements(CASE WHEN jsonb_typeof(p.value) = 'array' THEN p.value ELSE '[]'::jsonb END) AS a
+    ) AS child
+    WHERE p.depth < %s
+)
+SELECT path, jsonb_typeof(value) AS json_type, COUNT(DISTINCT doc_id) AS documents, (SELECT COUNT(*) FROM sampled)
+FROM paths
+WHERE depth > 0
+GROUP BY path, jsonb_typeof(value)
+ORDER BY path
+"""
 
-def _anonymize_value(value: Any) -> Any:
-    if value is None:
+
+@dataclass
+class _TableProfile:
+    count: int
+    count_strategy: str
+    sample_method: str
+    samples: list[dict[str, Any]]
+    seconds: float
+    reused: bool = False
+    # colonna jsonb -> {"sampled": righe lette, "paths": {percorso: {tipo json: documenti}}}
+    json_paths: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+
+def _fetch_postgres_table_catalog(conn: Any, schema: str) -> dict[str, dict[str, Any]]:
+    """Legge in una sola query le statistiche di catalogo di tutte le relazioni dello schema."""
+    with conn.cursor() as cur:
+        cur.execute(_TABLE_CATALOG_QUERY, (schema,))
+        rows = cur.fetchall()
+    columns = (
+        "relkind",
+        "reltuples",
+        "relpages",
+        "current_pages",
+        "n_live_tup",
+        "n_tup_ins",
+        "n_tup_upd",
+        "n_tup_del",
+        "last_analyze",
+        "last_autoanalyze",
+        "relispartition",
+        "partition_parent",
+    )
+    return {row[0]: dict(zip(columns, row[1:], strict=False)) for row in rows}
+
+
+def _postgres_fingerprint(
+    config: PostgresConfig,
+    attributes: list[Attribute],
+    infos: list[dict[str, Any]],
+) -> str | None:
+    """Impronta di una tabella: DDL delle colonne, contatori di modifica e parametri di profilazione."""
+    activity = [
+        info.get(key)
+        for info in infos
+        for key in ("n_tup_ins", "n_tup_upd", "n_tup_del", "last_analyze", "last_autoanalyze")
+    ]
+    if all(value is None for value in activity):
+        # Viste e foreign table non hanno contatori: non si può sapere se i dati sono cambiati.
         return None
-    if isinstance(value, bool):
-        return value
-    if isinstance(value, (int, float)):
-        return 0
-    if isinstance(value, str):
-        return "***"
-    if isinstance(value, dict):
-        return {k: _anonymize_value(v) for k, v in value.items()}
-    if isinstance(value, list):
-        return [_anonymize_value(v) for v in value]
-    return "***"
-
-
-def _anonymize_document(document: dict[str, Any]) -> dict[str, Any]:
-    masked: dict[str, Any] = {}
-    for key, value in document.items():
-        if _is_personal_key(key):
-            masked[key] = _anonymize_value(value)
-        elif isinstance(value, dict):
-            masked[key] = _anonymize_document(value)
-        elif isinstance(value, list):
-            masked[key] = [
-                _anonymize_document(item) if isinstance(item, dict) else item for item in value
+    payload = {
+        "columns": [[attr.name, attr.type, attr.nullable] for attr in attributes],
+        "activity": activity,
+        "profiling": [
+            config.count_strategy,
+            config.sample_method,
+            config.sample_records,
+            config.sample_text_max_chars,
+            config.sample_value_max_bytes,
+            config.sample_column_max_avg_bytes,
+            config.jsonb_inference,
+            config.jsonb_sample_rows,
+            config.jsonb_max_depth,
+            config.collapse_partitions,
+        ],
+    }
+    return _hash_payload(payload)
+
+
+def _partition_root(catalog: dict[str, dict[str, Any]], table: str) -> str:
+    """Risale la gerarchia di partizionamento fino all'antenato più alto presente nello schema."""
+    root = table
+    seen = {table}
+    while catalog.get(root, {}).get("relispartition"):
+        parent = catalog[root].get("partition_parent")
+        if parent is None or parent not in catalog or parent in seen:
+            break
+        seen.add(parent)
+        root = parent
+    return root
+
+
+def _partition_leaves(catalog: dict[str, dict[str, Any]]) -> dict[str, list[str]]:
+    """Mappa ogni tabella partizionata radice sulle sue partizioni foglia (anche a più livelli)."""
+    leaves: dict[str, list[str]] = {}
+    for table, info in sorted(catalog.items()):
+        if not info.get("relispartition") or info.get("relkind") == "p":
+            continue
+        root = _partition_root(catalog, table)
+        if root != table:
+            leaves.setdefault(root, []).append(table)
+    return leaves
+
+
+def _pick_sample_partitions(
+    partitions: list[str],
+    catalog: dict[str, dict[str, Any]],
+    count: int,
+) -> list[str]:
+    """Sceglie partizioni non vuote distribuite sull'intervallo (es. nel tempo per partizioni per data)."""
+    candidates = [p for p in partitions if _estimate_row_count(catalog.get(p, {})) != 0] or partitions
+    if count <= 0 or not candidates:
+        return []
+    if len(candidates) <= count:
+        return candidates
+    step = (len(candidates) - 1) / max(count - 1, 1)
+    return list(dict.fromkeys(candidates[round(i * step)] for i in range(count)))
+
+
+def _hash_payload(payload: Any) -> str:
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def _load_previous_discovery(path: str) -> tuple[dict[str, Entity], SampleStore]:
+    """Entità e campioni (inline o su file laterali) del modello salvato in precedenza."""
+    if not path or not Path(path).exists():
+        return {}, SampleStore()
+    previous = load_model(path)
+    samples = SampleStore.from_metadata(
+        previous.metadata.get("deep_discovery_samples", {}),
+        previous.metadata.get("deep_discovery_sample_files", {}),
+    )
+    return {entity.id: entity for entity in previous.entities}, samples
+
+
+def _fetch_postgres_constraints(conn: Any, schema: str) -> dict[str, dict[str, Any]]:
+    """Raggruppa per tabella PK, UNIQUE, FK (stesso schema) e definizioni degli indici."""
+    with conn.cursor() as cur:
+        cur.execute(_CONSTRAINTS_QUERY, (schema, schema))
+        rows = cur.fetchall()
+
+    by_table: dict[str, dict[str, Any]] = {}
+    for table, kind, con_type, name, columns, ref_schema, ref_table, ref_columns, method in rows:
+        info = by_table.setdefault(
+            table, {"primary_key": set(), "unique": set(), "references": {}, "indexes": []}
+        )
+        columns = list(columns or [])
+        if kind == "index":
+            info["indexes"].append(
+                {
+                    "name": name,
+                    "columns": columns,
+                    "unique": con_type in {"p", "u"},
+                    "primary": con_type == "p",
+                    "method": method,
+                }
+            )
+        elif con_type == "p":
+            info["primary_key"].update(columns)
+        elif con_type == "u" and len(columns) == 1:
+            # Un vincolo UNIQUE composto non rende univoca la singola colonna.
+            info["unique"].update(columns)
+        elif con_type == "f" and ref_schema == schema:
+            # Le FK verso altri schemi non hanno un'entità di destinazione nel modello.
+            # A parità di colonna vale il primo vincolo (quello padre, che precede i cloni `…_fkey1`).
+            for column, ref_column in zip(columns, ref_columns or [], strict=False):
+                info["references"].setdefault(column, f"pg:{ref_table}.{ref_column}")
+    return by_table
+
+
+def _apply_postgres_constraints(attributes: list[Attribute], info: dict[str, Any]) -> None:
+    single_unique_indexes = {
+        index["columns"][0] for index in info["indexes"] if index["unique"] and len(index["columns"]) == 1
+    }
+    for attr in attributes:
+        attr.primary_key = attr.name in info["primary_key"]
+        attr.unique = attr.primary_key or attr.name in info["unique"] or attr.name in single_unique_indexes
+        attr.references = info["references"].get(attr.name, "")
+
+
+def _fetch_postgres_column_stats(conn: Any, schema: str) -> dict[tuple[str, str], dict[str, Any]]:
+    """Legge da pg_stats il profilo di tutte le colonne dello schema, senza toccare le tabelle.
+
+    Le righe `inherited` (intera gerarchia) arrivano per ultime e prevalgono: per le tabelle
+    partizionate sono le uniche statistiche disponibili.
+    """
+    with conn.cursor() as cur:
+        cur.execute(_COLUMN_STATS_QUERY, (schema,))
+        rows = cur.fetchall()
+    return {
+        (table, column): {
+            "null_frac": float(null_frac),
+            "n_distinct": float(n_distinct),
+            "most_common_vals": list(common_values or []),
+            "histogram_min": histogram_min,
+            "histogram_max": histogram_max,
+            "avg_width": int(avg_width),
+        }
+        for table, column, null_frac, n_distinct, common_values, histogram_min, histogram_max, avg_width in rows
+    }
+
+
+def _apply_column_stats(
+    attributes: list[Attribute],
+    table: str,
+    column_stats: dict[tuple[str, str], dict[str, Any]],
+    row_estimate: int | None,
+    anonymizer: Anonymizer | None = None,
+) -> None:
+    anonymizer = anonymizer or get_anonymizer()
+    for attr in attributes:
+        stats = column_stats.get((table, attr.name))
+        if stats is None:
+            continue
+        stats = dict(stats)
+        if anonymizer.is_personal_key(attr.name):
+            # Valori frequenti ed estremi dell'istogramma sono dati reali: non vanno esposti.
+            stats["most_common_vals"] = []
+            stats["histogram_min"] = stats["histogram_max"] = None
+        else:
+            stats["most_common_vals"] = [
+                MASK if anonymizer.is_personal_value(value) else value for value in stats.get("most_common_vals", [])
             ]
+        n_distinct = stats["n_distinct"]
+        # n_distinct negativo in pg_stats è una frazione delle righe, positivo è un valore assoluto.
+        if n_distinct < 0 and row_estimate:
+            stats["distinct_estimate"] = int(round(-n_distinct * row_estimate))
+        elif n_distinct > 0:
+            stats["distinct_estimate"] = int(n_distinct)
+        attr.stats.update(stats)
+
+
+def _estimate_row_count(info: dict[str, Any]) -> int | None:
+    """Stima le righe come fa il planner: densità di reltuples scalata sulle pagine correnti."""
+    reltuples = info.get("reltuples")
+    relpages = info.get("relpages") or 0
+    live = info.get("n_live_tup")
+    if reltuples is not None and reltuples >= 0:
+        if relpages > 0:
+            return int(round(reltuples / relpages * (info.get("current_pages") or 0)))
+        return int(live) if live is not None else int(reltuples)
+    # reltuples = -1: tabella mai analizzata, si ripiega sul contatore di pg_stat_user_tables.
+    return int(live) if live is not None else None
+
+
+def _resolve_count_strategy(strategy: str, estimate: int | None, threshold: int) -> str:
+    if estimate is None or strategy == "exact":
+        return "exact"
+    if strategy == "hybrid" and estimate < threshold:
+        return "exact"
+    return "estimate"
+
+
+def _tablesample_percent(sample_records: int, row_estimate: int | None) -> float | None:
+    """Percentuale TABLESAMPLE che restituisce circa `sample_records` righe, qualunque sia la dimensione."""
+    if not row_estimate or row_estimate <= 0 or sample_records <= 0:
+        return None
+    percent = sample_records * _TABLESAMPLE_OVERSAMPLE / row_estimate * 100
+    return min(100.0, max(percent, 0.0001))
+
+
+def _tablesample_clause(
+    sql: Any,
+    method: str,
+    relkind: str | None,
+    row_estimate: int | None,
+    limit: int,
+) -> tuple[Any, tuple[Any, ...], str]:
+    """Clausola TABLESAMPLE (con parametri) oppure vuota se il metodo o la relazione non la ammettono."""
+    percent = _tablesample_percent(limit, row_estimate)
+    if method == "limit" or relkind not in _TABLESAMPLE_RELKINDS or percent is None:
+        # Viste e foreign table non supportano TABLESAMPLE: si ripiega sul LIMIT.
+        return sql.SQL(""), (), "limit"
+    return sql.SQL(" TABLESAMPLE " + method.upper() + " (%s)"), (percent,), method
+
+
+def _sample_projection(
+    sql: Any,
+    config: PostgresConfig,
+    attributes: list[Attribute] | None,
+) -> tuple[Any, list[str]]:
+    """Proiezione dei campioni con payload limitato; restituisce anche le colonne escluse."""
+    if not attributes:
+        return sql.SQL("*"), []
+    fields = []
+    skipped = []
+    for attr in attributes:
+        avg_width = attr.stats.get("avg_width") or 0
+        if config.sample_column_max_avg_bytes and avg_width > config.sample_column_max_avg_bytes:
+            skipped.append(attr.name)
+            continue
+        column = sql.Identifier(attr.name)
+        if attr.type == "bytea":
+            # Per l'anonimizzazione basta sapere che c'è un binario e quanto pesa.
+            expression = sql.SQL("'<bytea ' || octet_length({}) || ' bytes>'").format(column)
+        elif attr.type in _TEXT_TYPES and config.sample_text_max_chars:
+            expression = sql.SQL("left({}, {})").format(column, sql.Literal(config.sample_text_max_chars))
+        elif attr.type in _JSON_TYPES and config.sample_value_max_bytes:
+            expression = sql.SQL(
+                "CASE WHEN pg_column_size({0}) > {1} "
+                "THEN jsonb_build_object('truncated_bytes', pg_column_size({0})) ELSE {0}::jsonb END"
+            ).format(column, sql.Literal(config.sample_value_max_bytes))
+        else:
+            fields.append(column)
+            continue
+        fields.append(sql.SQL("{} AS {}").format(expression, column))
+    if not fields:
+        return sql.SQL("NULL AS skipped"), skipped
+    return sql.SQL(", ").join(fields), skipped
+
+
+def _build_sample_query(
+    sql: Any,
+    config: PostgresConfig,
+    table: str,
+    relkind: str | None,
+    row_estimate: int | None,
+    limit: int | None = None,
+    attributes: list[Attribute] | None = None,
+) -> tuple[Any, tuple[Any, ...], str]:
+    limit = config.sample_records if limit is None else limit
+    target = sql.SQL("{}.{}").format(sql.Identifier(config.schema), sql.Identifier(table))
+    projection, _ = _sample_projection(sql, config, attributes)
+    clause, clause_params, method = _tablesample_clause(sql, config.sample_method, relkind, row_estimate, limit)
+    if method == "limit":
+        return sql.SQL("SELECT {} FROM {} LIMIT %s").format(projection, target), (limit,), "limit"
+    query = sql.SQL("SELECT {} FROM {}{} LIMIT %s").format(projection, target, clause)
+    # Si legge il doppio del necessario e si riduce lato client, per non favorire le prime pagine.
+    return query, (*clause_params, limit * 2), method
+
+
+def _reservoir_sample(rows: Iterable[Any], size: int, rng: random.Random | None = None) -> list[Any]:
+    """Campione uniforme di `size` elementi da uno stream, con memoria limitata a `size` (algoritmo R)."""
+    rng = rng or random.Random()
+    reservoir: list[Any] = []
+    for index, row in enumerate(rows):
+        if index < size:
+            reservoir.append(row)
+            continue
+        slot = rng.randint(0, index)
+        if slot < size:
+            reservoir[slot] = row
+    return reservoir
+
+
+def _infer_jsonb_paths(
+    cur: Any,
+    sql: Any,
+    config: PostgresConfig,
+    table: str,
+    column: str,
+    relkind: str | None,
+    row_estimate: int | None,
+) -> dict[str, Any]:
+    # Per la struttura serve comunque un campione sparso: SYSTEM salvo richiesta esplicita di BERNOULLI.
+    method = "bernoulli" if config.sample_method == "bernoulli" else "system"
+    clause, clause_params, _ = _tablesample_clause(sql, method, relkind, row_estimate, config.jsonb_sample_rows)
+    query = sql.SQL(_JSONB_PATHS_QUERY).format(
+        column=sql.Identifier(column),
+        table=sql.SQL("{}.{}").format(sql.Identifier(config.schema), sql.Identifier(table)),
+        tablesample=clause,
+    )
+    cur.execute(query, (*clause_params, config.jsonb_sample_rows, config.jsonb_max_depth))
+    paths: dict[str, dict[str, int]] = {}
+    sampled = 0
+    for path, json_type, documents, sampled_rows in cur.fetchall():
+        paths.setdefault(path, {})[json_type] = int(documents)
+        sampled = int(sampled_rows)
+    return {"sampled": sampled, "paths": paths}
+
+
+def _json_paths_from_attributes(attributes: list[Attribute]) -> dict[str, dict[str, Any]]:
+    """Ricostruisce i percorsi jsonb da attributi annidati già scoperti (discovery incrementale)."""
+    json_paths: dict[str, dict[str, Any]] = {}
+    for attr in attributes:
+        if "json_types" not in attr.stats or "." not in attr.name:
+            continue
+        column, path = attr.name.split(".", 1)
+        info = json_paths.setdefault(column, {"sampled": attr.stats.get("sampled_rows", 0), "paths": {}})
+        info["paths"][path] = dict(attr.stats["json_types"])
+    return json_paths
+
+
+def _merge_json_paths(target: dict[str, dict[str, Any]], source: dict[str, dict[str, Any]]) -> None:
+    for column, info in source.items():
+        merged = target.setdefault(column, {"sampled": 0, "paths": {}})
+        merged["sampled"] += info["sampled"]
+        for path, types in info["paths"].items():
+            merged_types = merged["paths"].setdefault(path, {})
+            for json_type, documents in types.items():
+                merged_types[json_type] = merged_types.get(json_type, 0) + documents
+
+
+def _json_path_attributes(column: str, info: dict[str, Any]) -> list[Attribute]:
+    """Attributi annidati `colonna.percorso` con tipo prevalente e rapporto di presenza."""
+    sampled = info["sampled"]
+    attributes = []
+    for path, types in sorted(info["paths"].items()):
+        documents = min(sum(types.values()), sampled) if sampled else 0
+        presence = round(documents / sampled, 4) if sampled else 0.0
+        attributes.append(
+            Attribute(
+                name=f"{column}.{path}",
+                type=max(types.items(), key=lambda item: item[1])[0],
+                nullable=presence < 1 or "null" in types,
+                source="postgres",
+                stats={
+                    "presence_ratio": presence,
+                    "json_types": dict(sorted(types.items())),
+                    "sampled_rows": sampled,
+                },
+            )
+        )
+    return attributes
+
+
+def _profile_postgres_table(
+    conn: Any,
+    sql: Any,
+    config: PostgresConfig,
+    table: str,
+    catalog: dict[str, Any],
+    sample_records: int,
+    jsonb_columns: list[str] | None = None,
+    attributes: list[Attribute] | None = None,
+) -> _TableProfile:
+    """Esegue conteggio e campionamento di una tabella, restituendo anche il tempo impiegato."""
+    started = time.perf_counter()
+    estimate = _estimate_row_count(catalog)
+    count_strategy = _resolve_count_strategy(config.count_strategy, estimate, config.exact_count_threshold)
+    row_estimate = estimate
+    with conn.cursor() as cur:
+        if count_strategy == "exact":
+            cur.execute(
+                sql.SQL("SELECT COUNT(*) FROM {}.{}").format(
+                    sql.Identifier(config.schema),
+                    sql.Identifier(table),
+                )
+            )
+            count = int(cur.fetchone()[0])
+            row_estimate = count
         else:
-            masked[key] = value
-    return masked
+            count = int(estimate or 0)
+
+        # L'inferenza jsonb è indipendente dalla quota campioni: vale anche con `sample_records=0`.
+        json_paths = {}
+        if config.jsonb_inference:
+            for column in jsonb_columns or []:
+                json_paths[column] = _infer_jsonb_paths(
+                    cur, sql, config, table, column, catalog.get("relkind"), row_estimate
+                )
 
+    samples: list[dict[str, Any]] = []
+    sample_method = ""
+    if sample_records > 0:
+        query, params, sample_method = _build_sample_query(
+            sql, config, table, catalog.get("relkind"), row_estimate, sample_records, attributes
+        )
+        # Cursore lato server: le righe arrivano a blocchi e ne restano in memoria al più `sample_records`.
+        # Pipeline: fetch → anonimizzazione → reservoir; nessuna riga in chiaro resta in memoria.
+        anonymize = _anonymizer(config).anonymize
+        with conn.cursor(name="dmn_sample") as cur:
+            cur.itersize = max(1, config.sample_fetch_size)
+            cur.execute(query, params)
+            columns = [desc.name for desc in cur.description]
+            samples = _reservoir_sample(
+                (anonymize(dict(zip(columns, row, strict=False))) for row in cur), sample_records
+            )
+    return _TableProfile(
+        count=count,
+        count_strategy=count_strategy,
+        sample_method=sample_method,
+        samples=samples,
+        seconds=time.perf_counter() - started,
+        json_paths=json_paths,
+    )
+
+
+def _merge_partition_profiles(profiles: list[_TableProfile]) -> _TableProfile:
+    strategies = {p.count_strategy for p in profiles}
+    methods = [p.sample_method for p in profiles if p.sample_method]
+    json_paths: dict[str, dict[str, Any]] = {}
+    for profile in profiles:
+        _merge_json_paths(json_paths, profile.json_paths)
+    return _TableProfile(
+        count=sum(p.count for p in profiles),
+        count_strategy=strategies.pop() if len(strategies) == 1 else "estimate",
+        sample_method=methods[0] if methods else "",
+        samples=[record for p in profiles for record in p.samples],
+        seconds=sum(p.seconds for p in profiles),
+        json_paths=json_paths,
+    )
 
-def discover_postgres(config: PostgresConfig) -> tuple[list[Entity], dict[str, int], dict[str, list[dict[str, Any]]]]:
+
+def discover_postgres(
+    config: PostgresConfig,
+    cancel: threading.Event | None = None,
+) -> tuple[list[Entity], dict[str, int], SampleStore]:
     try:
         import psycopg
         from psycopg import sql
@@ -98,10 +849,18 @@ def discover_postgres(config: PostgresConfig) -> tuple[list[Entity], dict[str, i
         raise RuntimeError(
             "Manca dipendenza psycopg. Installa con: pip install psycopg[binary]"
         ) from exc
+    if config.count_strategy not in COUNT_STRATEGIES:
+        raise ValueError(
+            f"count_strategy PostgreSQL non valida: {config.count_strategy!r} (ammesse: {', '.join(COUNT_STRATEGIES)})"
+        )
+    if config.sample_method not in SAMPLE_METHODS:
+        raise ValueError(
+            f"sample_method PostgreSQL non valido: {config.sample_method!r} (ammessi: {', '.join(SAMPLE_METHODS)})"
+        )
 
     entities: list[Entity] = []
     table_counts: dict[str, int] = {}
-    samples_by_table: dict[str, list[dict[str, Any]]] = {}
+    samples_by_table = _sample_store(config, "postgres")
 
     query = """
     SELECT c.table_name, c.column_name, c.data_type, c.is_nullable
@@ -109,16 +868,12 @@ def discover_postgres(config: PostgresConfig) -> tuple[list[Entity], dict[str, i
     WHERE c.table_schema = %s
     ORDER BY c.table_name, c.ordinal_position
     """
-    with psycopg.connect(
-        host=config.host,
-        port=config.port,
-        dbname=config.dbname,
-        user=config.user,
-        password=config.password,
-    ) as conn:
+    with _connect_postgres(psycopg, config) as conn:
         with conn.cursor() as cur:
             cur.execute(query, (config.schema,))
             rows = cur.fetchall()
+        catalog = _fetch_postgres_table_catalog(conn, config.schema)
+        constraints = _fetch_postgres_constraints(conn, config.schema)
 
         by_table: dict[str, list[Attribute]] = {}
         for table, column, dtype, is_nullable in rows:
@@ -130,114 +885,813 @@ def discover_postgres(config: PostgresConfig) -> tuple[list[Entity], dict[str, i
                     source="postgres",
                 )
             )
+        partitions = _partition_leaves(catalog) if config.collapse_partitions else {}
+        if config.collapse_partitions:
+            # Partizioni foglia e intermedie confluiscono nell'entità della tabella radice.
+            by_table = {
+                table: attributes
+                for table, attributes in by_table.items()
+                if _partition_root(catalog, table) == table
+            }
 
+        column_stats = _fetch_postgres_column_stats(conn, config.schema) if config.column_stats else {}
         for table, attributes in by_table.items():
-            entities.append(
-                Entity(
-                    id=f"pg:{table}",
-                    name=table,
-                    source_system="postgres",
-                    source_type="table",
-                    attributes=attributes,
+            if table in constraints:
+                _apply_postgres_constraints(attributes, constraints[table])
+            if column_stats:
+                _apply_column_stats(
+                    attributes, table, column_stats, _estimate_row_count(catalog.get(table, {})), _anonymizer(config)
                 )
+
+        physical_tables = {table: partitions.get(table, [table]) for table in by_table}
+        fingerprints = {
+            table: _postgres_fingerprint(
+                config, attributes, [catalog.get(name, {}) for name in physical_tables[table]]
             )
-            with conn.cursor() as cur:
-                cur.execute(
-                    sql.SQL("SELECT COUNT(*) FROM {}.{}").format(
-                        sql.Identifier(config.schema),
-                        sql.Identifier(table),
-                    )
-                )
-                table_counts[table] = int(cur.fetchone()[0])
-
-                cur.execute(
-                    sql.SQL("SELECT * FROM {}.{} LIMIT %s").format(
-                        sql.Identifier(config.schema),
-                        sql.Identifier(table),
-                    ),
-                    (config.sample_records,),
+            for table, attributes in by_table.items()
+        }
+        results: dict[str, _TableProfile] = {}
+        if config.incremental:
+            previous_entities, previous_samples = _load_previous_discovery(config.previous_model_path)
+            for table, fingerprint in fingerprints.items():
+                previous = previous_entities.get(f"pg:{table}")
+                if fingerprint is None or previous is None or previous.profile.get("fingerprint") != fingerprint:
+                    continue
+                if "row_count" not in previous.profile or f"pg:{table}" not in previous_samples:
+                    # Senza i campioni precedenti (es. file laterale rimosso) la tabella va riprofilata.
+                    continue
+                results[table] = _TableProfile(
+                    count=int(previous.profile["row_count"]),
+                    count_strategy=previous.profile.get("count_strategy", "exact"),
+                    sample_method=previous.profile.get("sample_method", "limit"),
+                    samples=[],
+                    seconds=0.0,
+                    reused=True,
+                    json_paths=_json_paths_from_attributes(previous.attributes),
                 )
-                records = cur.fetchall()
-                columns = [desc.name for desc in cur.description]
-                samples_by_table[table] = [
-                    _anonymize_document(dict(zip(columns, row, strict=False))) for row in records
-                ]
+                samples_by_table.put(table, previous_samples.get(f"pg:{table}", []))
+
+        # Unità di lavoro: (entità, tabella fisica, quota campioni). Una tabella partizionata
+        # produce un'unità per partizione, così anche le gerarchie grandi sfruttano il pool.
+        work: list[tuple[str, str, int]] = []
+        sampled_partitions: dict[str, list[str]] = {}
+        for table in by_table:
+            if table in results:
+                continue
+            if table not in partitions:
+                work.append((table, table, config.sample_records))
+                continue
+            sampled = _pick_sample_partitions(partitions[table], catalog, config.partition_sample_count)
+            sampled_partitions[table] = sampled
+            quota = -(-config.sample_records // len(sampled)) if sampled else 0
+            for leaf in partitions[table]:
+                work.append((table, leaf, quota if leaf in sampled else 0))
+
+        jsonb_columns = {
+            table: [attr.name for attr in attributes if attr.type == "jsonb"] if config.jsonb_inference else []
+            for table, attributes in by_table.items()
+        }
+
+        def run(item: tuple[str, str, int], worker_conn: Any) -> _TableProfile:
+            _check_cancelled(cancel)
+            table, physical, quota = item
+            # Per le tabelle partizionate i percorsi jsonb vengono dalle sole partizioni scelte.
+            infer_jsonb = table not in partitions or physical in sampled_partitions.get(table, [])
+            result = _profile_postgres_table(
+                worker_conn,
+                sql,
+                config,
+                physical,
+                catalog.get(physical, {}),
+                quota,
+                jsonb_columns[table] if infer_jsonb else [],
+                by_table[table],
+            )
+            if table not in partitions:
+                # Sink immediato: i campioni della tabella lasciano il worker appena prodotti.
+                samples_by_table.put(table, result.samples)
+                result.samples = []
+            return result
+
+        if config.pool_size > 1 and len(work) > 1:
+            # Count e sample per tabella in parallelo su un pool limitato di connessioni dedicate.
+            pool = _PostgresConnectionPool(
+                lambda: _connect_postgres(psycopg, config), config.pool_size, initial=conn
+            )
+
+            def profile(item: tuple[str, str, int]) -> _TableProfile:
+                with pool.connection() as worker_conn:
+                    return run(item, worker_conn)
+
+            try:
+                with ThreadPoolExecutor(max_workers=config.pool_size) as executor:
+                    work_results = _map_fail_fast(executor, profile, work)
+            finally:
+                pool.close()
+        else:
+            work_results = [run(item, conn) for item in work]
+
+        by_entity: dict[str, list[_TableProfile]] = {}
+        for (table, _, _), result in zip(work, work_results, strict=True):
+            by_entity.setdefault(table, []).append(result)
+        for table, profiles in by_entity.items():
+            merged = _merge_partition_profiles(profiles) if table in partitions else profiles[0]
+            if table in partitions:
+                samples_by_table.put(table, merged.samples[: config.sample_records])
+                merged.samples = []
+            results[table] = merged
+
+    # Il merge segue l'ordine del catalogo, indipendentemente dall'ordine di completamento.
+    for table, attributes in by_table.items():
+        result = results[table]
+        if result.json_paths:
+            expanded: list[Attribute] = []
+            for attr in attributes:
+                expanded.append(attr)
+                if attr.name in result.json_paths:
+                    expanded.extend(_json_path_attributes(attr.name, result.json_paths[attr.name]))
+            attributes = expanded
+        profile: dict[str, Any] = {
+            "row_count": result.count,
+            "count_strategy": result.count_strategy,
+            "sample_method": result.sample_method,
+            "fingerprint": fingerprints[table],
+        }
+        _, skipped_columns = _sample_projection(sql, config, attributes)
+        if skipped_columns:
+            profile["skipped_sample_columns"] = skipped_columns
+        if table in partitions:
+            profile["partitions"] = len(partitions[table])
+            if table in sampled_partitions:
+                profile["sampled_partitions"] = sampled_partitions[table]
+        if result.reused:
+            profile["reused"] = True
+        else:
+            profile["profile_seconds"] = round(result.seconds, 4)
+        entities.append(
+            Entity(
+                id=f"pg:{table}",
+                name=table,
+                source_system="postgres",
+                source_type="table",
+                attributes=attributes,
+                indexes=constraints.get(table, {}).get("indexes", []),
+                profile=profile,
+            )
+        )
+        table_counts[table] = result.count
 
     return entities, table_counts, samples_by_table
 
 
-def discover_mongo(config: MongoConfig) -> tuple[list[Entity], dict[str, int], dict[str, list[dict[str, Any]]]]:
+_MONGO_SYSTEM_DATABASES = {"admin", "local", "config"}
+_BINARY_STUB_PREFIX = "<binData "
+_BINARY_STUB_SUFFIX = " bytes>"
+
+
+@dataclass
+class _CollectionProfile:
+    attributes: list[Attribute]
+    count: int
+    count_strategy: str
+    samples: list[dict[str, Any]]
+    seconds: float
+    # Valori ObjectId campionati per percorso, candidati per il rilevamento dei riferimenti.
+    object_ids: dict[str, list[Any]] = field(default_factory=dict)
+    variants: list[dict[str, Any]] = field(default_factory=list)
+
+
+def _collect_object_ids(document: dict[str, Any], found: dict[str, list[Any]], limit: int, max_depth: int) -> None:
+    """Raccoglie fino a `limit` ObjectId distinti per percorso (stessi nomi dello schema: `items[].sku`)."""
+    stack: list[tuple[str, Any, int]] = [(key, value, 1) for key, value in document.items() if key != "_id"]
+    while stack:
+        path, value, depth = stack.pop()
+        if type(value).__name__ == "ObjectId":
+            values = found.setdefault(path, [])
+            if len(values) < limit and value not in values:
+                values.append(value)
+        elif depth < max_depth and isinstance(value, dict):
+            stack.extend((f"{path}.{key}", child, depth + 1) for key, child in value.items())
+        elif depth < max_depth and isinstance(value, list):
+            stack.extend((f"{path}[]", item, depth + 1) for item in value)
+
+
+def _fetch_mongo_collection_stats(collection: Any) -> dict[str, Any]:
+    """Statistiche di storage della collection da metadati, senza scansioni."""
+    try:
+        # Su cluster shardati $collStats restituisce un documento per shard: si sommano.
+        shards = [doc.get("storageStats", {}) for doc in collection.aggregate([{"$collStats": {"storageStats": {}}}])]
+        return {
+            "count": sum(int(shard.get("count", 0)) for shard in shards),
+            "size": sum(int(shard.get("size", 0)) for shard in shards),
+            "indexes": sorted({index for shard in shards for index in shard.get("indexSizes", {})}),
+        }
+    except Exception:  # noqa: BLE001
+        # Le view non supportano $collStats: si tenta il conteggio da metadati.
+        try:
+            return {"count": int(collection.estimated_document_count())}
+        except Exception:  # noqa: BLE001
+            return {}
+
+
+def _fetch_mongo_indexes(collection: Any) -> list[dict[str, Any]]:
+    """Definizioni degli indici nello stesso formato usato per PostgreSQL."""
+    try:
+        raw_indexes = list(collection.list_indexes())
+    except Exception:  # noqa: BLE001
+        # Le view non hanno indici propri.
+        return []
+    indexes = []
+    for raw in raw_indexes:
+        keys = list(dict(raw.get("key", {})).items())
+        kinds = {value for _, value in keys if isinstance(value, str)}
+        index: dict[str, Any] = {
+            "name": raw.get("name", ""),
+            "columns": [name for name, _ in keys],
+            "unique": bool(raw.get("unique", False)) or raw.get("name") == "_id_",
+            "primary": raw.get("name") == "_id_",
+            "method": kinds.pop() if len(kinds) == 1 else "btree",
+        }
+        if raw.get("partialFilterExpression") or raw.get("sparse"):
+            index["partial"] = True
+        indexes.append(index)
+    return indexes
+
+
+def _apply_mongo_indexes(attributes: list[Attribute], indexes: list[dict[str, Any]]) -> None:
+    # Solo gli indici unici completi a campo singolo garantiscono l'unicità del campo.
+    unique_fields = {
+        index["columns"][0]
+        for index in indexes
+        if index["unique"] and len(index["columns"]) == 1 and not index.get("partial")
+    }
+    primary_fields = {index["columns"][0] for index in indexes if index["primary"] and index["columns"]}
+    for attr in attributes:
+        attr.primary_key = attr.name in primary_fields
+        attr.unique = attr.primary_key or attr.name in unique_fields
+
+
+def _mongo_schema_hash(attributes: list[Attribute]) -> str:
+    """Hash dello schema inferito, salvato in `profile["schema_hash"]` al momento della discovery.
+
+    Il confronto usa il valore salvato e non gli attributi del modello, che la fase di
+    configurazione può modificare (es. `auto_cleanup` rimuove i campi tecnici).
+    """
+    return _hash_payload([[attr.name, attr.type, attr.nullable] for attr in attributes])
+
+
+def _mongo_fingerprint(config: MongoConfig, stats: dict[str, Any], schema_hash: str | None) -> str | None:
+    """Impronta di una collection: $collStats (count, size, indici), schema inferito e parametri di profilazione."""
+    if "size" not in stats or schema_hash is None:
+        # Senza $collStats (es. view) non si può sapere se i dati sono cambiati.
+        return None
+    payload = {
+        "stats": [stats.get("count"), stats.get("size"), stats.get("indexes", [])],
+        "schema": schema_hash,
+        "profiling": [
+            config.count_strategy,
+            config.sample_size,
+            config.sample_records,
+            config.server_side_profiling,
+            config.schema_max_depth,
+            config.sample_max_array_items,
+            config.sample_max_string_length,
+            config.sample_binary,
+        ],
+    }
+    return _hash_payload(payload)
+
+
+# Nomi $type BSON allineati ai nomi di tipo Python usati dall'inferenza lato client.
+_BSON_TYPE_NAMES = {
+    "string": "str",
+    "int": "int",
+    "long": "int",
+    "double": "float",
+    "decimal": "Decimal128",
+    "bool": "bool",
+    "date": "datetime",
+    "objectId": "ObjectId",
+    "object": "dict",
+    "array": "list",
+    "binData": "bytes",
+    "null": "NoneType",
+    "timestamp": "Timestamp",
+    "regex": "Regex",
+}
+
+
+def _profile_mongo_fields_server_side(collection: Any, size: int) -> list[Attribute]:
+    """Presenza e distribuzione dei tipi dei campi di primo livello calcolate dal server."""
+    pipeline = [
+        {"$sample": {"size": size}},
+        {
+            "$facet": {
+                "sampled": [{"$count": "documents"}],
+                "fields": [
+                    {"$project": {"field": {"$objectToArray": "$$ROOT"}}},
+                    {"$unwind": "$field"},
+                    {
+                        "$group": {
+                            "_id": {"name": "$field.k", "type": {"$type": "$field.v"}},
+                            "documents": {"$sum": 1},
+                        }
+                    },
+                ],
+            }
+        },
+    ]
+    result = next(iter(collection.aggregate(pipeline)), {})
+    sampled = result.get("sampled", [{}])[0].get("documents", 0) if result.get("sampled") else 0
+    types_by_field: dict[str, dict[str, int]] = {}
+    for group in result.get("fields", []):
+        type_name = _BSON_TYPE_NAMES.get(group["_id"]["type"], group["_id"]["type"])
+        types_by_field.setdefault(group["_id"]["name"], {})[type_name] = int(group["documents"])
+
+    attributes = []
+    for name, types in sorted(types_by_field.items()):
+        # $objectToArray restituisce ogni campo una sola volta per documento.
+        presence = round(sum(types.values()) / sampled, 4) if sampled else 0.0
+        present = {type_name: count for type_name, count in types.items() if type_name != "NoneType"}
+        attributes.append(
+            Attribute(
+                name=name,
+                type=max(present.items(), key=lambda item: item[1])[0] if present else "unknown",
+                nullable=presence < 1 or "NoneType" in types,
+                source="mongo",
+                stats={"presence_ratio": presence, "types": dict(sorted(types.items()))},
+            )
+        )
+    return attributes
+
+
+def _mongo_sample_projection(config: MongoConfig, schema_stream: bool = False) -> list[dict[str, Any]]:
+    """Stage che limitano lato server i campi di primo livello dei documenti campionati.
+
+    Con `schema_stream` i documenti alimentano anche l'inferenza di schema: gli array restano
+    interi (lunghezze e percorsi `items[]` reali) e i BinData diventano sempre stub, che restano di
+    tipo `bytes`; troncamento e `drop` sono applicati ai soli campioni da `_cap_mongo_value`.
+    """
+    branches: list[dict[str, Any]] = []
+    if config.sample_max_string_length > 0:
+        branches.append(
+            {
+                "case": {"$eq": [{"$type": "$$field.v"}, "string"]},
+                "then": {"$substrCP": ["$$field.v", 0, config.sample_max_string_length]},
+            }
+        )
+    if config.sample_max_array_items > 0 and not schema_stream:
+        branches.append(
+            {
+                "case": {"$eq": [{"$type": "$$field.v"}, "array"]},
+                "then": {"$slice": ["$$field.v", config.sample_max_array_items]},
+            }
+        )
+    if config.sample_binary == "stub" or schema_stream:
+        branches.append(
+            {
+                "case": {"$eq": [{"$type": "$$field.v"}, "binData"]},
+                "then": {
+                    "$concat": [_BINARY_STUB_PREFIX, {"$toString": {"$binarySize": "$$field.v"}}, _BINARY_STUB_SUFFIX]
+                },
+            }
+        )
+    fields: dict[str, Any] = {"$objectToArray": "$$ROOT"}
+    if config.sample_binary == "drop" and not schema_stream:
+        fields = {"$filter": {"input": fields, "as": "field", "cond": {"$ne": [{"$type": "$$field.v"}, "binData"]}}}
+    if not branches and fields.get("$objectToArray"):
+        return []
+    capped = {"$switch": {"branches": branches, "default": "$$field.v"}} if branches else "$$field.v"
+    return [
+        {
+            "$replaceRoot": {
+                "newRoot": {
+                    "$arrayToObject": {
+                        "$map": {"input": fields, "as": "field", "in": {"k": "$$field.k", "v": capped}}
+                    }
+                }
+            }
+        }
+    ]
+
+
+def _is_binary_stub(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(_BINARY_STUB_PREFIX) and value.endswith(_BINARY_STUB_SUFFIX)
+
+
+def _cap_mongo_value(value: Any, config: MongoConfig) -> Any:
+    """Stessi limiti della proiezione server, applicati ai livelli annidati che $replaceRoot non raggiunge."""
+    if isinstance(value, dict):
+        # Con `drop` si scartano anche gli stub prodotti dalla proiezione del flusso di schema.
+        return {
+            key: _cap_mongo_value(item, config)
+            for key, item in value.items()
+            if not (config.sample_binary == "drop" and (isinstance(item, bytes) or _is_binary_stub(item)))
+        }
+    if isinstance(value, list):
+        items = value[: config.sample_max_array_items] if config.sample_max_array_items > 0 else value
+        return [_cap_mongo_value(item, config) for item in items]
+    if isinstance(value, bytes) and config.sample_binary == "stub":
+        return f"{_BINARY_STUB_PREFIX}{len(value)}{_BINARY_STUB_SUFFIX}"
+    if isinstance(value, str) and config.sample_max_string_length > 0:
+        return value[: config.sample_max_string_length]
+    return value
+
+
+def _mongo_type_name(value: Any) -> str:
+    # I BinData sostituiti dalla proiezione restano di tipo binario per l'inferenza di schema.
+    if _is_binary_stub(value):
+        return "bytes"
+    return type(value).__name__
+
+
+def _sample_mongo_documents(
+    collection: Any,
+    size: int,
+    projection: list[dict[str, Any]] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Campione casuale lato server con un solo passaggio di lettura per collection."""
+    if size <= 0:
+        return iter(())
+    return collection.aggregate([{"$sample": {"size": size}}, *(projection or [])])
+
+
+def _profile_mongo_collection(collection: Any, config: MongoConfig, stats: dict[str, Any]) -> _CollectionProfile:
+    started = time.perf_counter()
+    estimate = stats.get("count")
+    count_strategy = _resolve_count_strategy(config.count_strategy, estimate, config.exact_count_threshold)
+    if count_strategy == "exact":
+        count = int(collection.count_documents({}))
+    else:
+        count = int(estimate or 0)
+
+    deep_samples: list[dict[str, Any]] = []
+    object_ids: dict[str, list[Any]] = {}
+    anonymize = _anonymizer(config).anonymize
+    probe_size = config.reference_probe_size if config.reference_detection else 0
+    shapes = ShapeClusterer(anonymizer=_anonymizer(config)) if config.variant_detection else None
+    if config.server_side_profiling:
+        # Le varianti si calcolano sui soli documenti della deep discovery.
+        attributes = _profile_mongo_fields_server_side(collection, config.sample_size)
+        projection = _mongo_sample_projection(config)
+        for doc in _sample_mongo_documents(collection, config.sample_records, projection):
+            if probe_size:
+                _collect_object_ids(doc, object_ids, probe_size, config.schema_max_depth)
+            if shapes is not None:
+                shapes.add(doc)
+            deep_samples.append(anonymize(_cap_mongo_value(doc, config)))
+    else:
+        # Un solo $sample grande quanto il maggiore dei due campioni: lo schema usa tutti i
+        # documenti, la deep discovery i primi `sample_records` (già in ordine casuale).
+        # La proiezione non tronca gli array: lunghezze e percorsi restano quelli reali.
+        schema = SchemaTrie(max_depth=config.schema_max_depth, type_name=_mongo_type_name)
+        projection = _mongo_sample_projection(config, schema_stream=True)
+        for doc in _sample_mongo_documents(collection, max(config.sample_size, config.sample_records), projection):
+            schema.add(doc)
+            if shapes is not None:
+                shapes.add(doc)
+            if probe_size:
+                _collect_object_ids(doc, object_ids, probe_size, config.schema_max_depth)
+            if len(deep_samples) < config.sample_records:
+                deep_samples.append(anonymize(_cap_mongo_value(doc, config)))
+        attributes = schema.attributes(source="mongo")
+    return _CollectionProfile(
+        attributes=attributes,
+        count=count,
+        count_strategy=count_strategy,
+        samples=deep_samples,
+        seconds=time.perf_counter() - started,
+        object_ids=object_ids,
+        variants=shapes.variants(config.max_variants) if shapes is not None else [],
+    )
+
+
+def _detect_mongo_references(
+    entities: list[Entity],
+    collections: dict[str, Any],
+    object_ids: dict[str, dict[str, list[Any]]],
+    config: MongoConfig,
+    cancel: threading.Event | None = None,
+) -> None:
+    """Associa i campi ObjectId alla collection il cui `_id` contiene la maggior parte dei valori campionati.
+
+    Per ogni coppia (campo, collection candidata) un solo `count_documents` con `$in` su `_id`:
+    la ricerca usa sempre l'indice `_id_`, quindi il costo dipende dal campione e non dalla collection.
+    Sono candidate solo le collection con `_id` di tipo ObjectId.
+    """
+    candidates = [
+        entity
+        for entity in entities
+        if entity.id.removeprefix("mg:") in collections
+        and "_id" in indexed_fields(entity)
+        and any(attr.name == "_id" and attr.type == "ObjectId" for attr in entity.attributes)
+    ]
+    probes: list[tuple[Entity, Attribute, Entity, list[Any]]] = []
+    for entity in entities:
+        fields = object_ids.get(entity.id.removeprefix("mg:"), {})
+        for attr in entity.attributes:
+            if attr.references or not fields.get(attr.name):
+                continue
+            probes.extend((entity, attr, target, fields[attr.name]) for target in candidates)
+    if not probes:
+        return
+
+    def probe(item: tuple[Entity, Attribute, Entity, list[Any]]) -> float:
+        _check_cancelled(cancel)
+        _, _, target, values = item
+        collection = collections[target.id.removeprefix("mg:")]
+        hits = int(collection.count_documents({"_id": {"$in": values}}))
+        return hits / len(values)
+
+    with ThreadPoolExecutor(max_workers=max(1, config.reference_probe_concurrency)) as executor:
+        ratios = _map_fail_fast(executor, probe, probes)
+
+    best: dict[tuple[str, str], tuple[float, Entity]] = {}
+    for (entity, attr, target, _), ratio in zip(probes, ratios, strict=True):
+        key = (entity.id, attr.name)
+        if ratio >= config.reference_min_hit_ratio and ratio > best.get(key, (0.0, target))[0]:
+            best[key] = (ratio, target)
+    for entity in entities:
+        for attr in entity.attributes:
+            match = best.get((entity.id, attr.name))
+            if match is not None:
+                ratio, target = match
+                attr.references = f"{target.id}._id"
+                attr.stats["reference_hit_ratio"] = round(ratio, 4)
+
+
+def discover_mongo(
+    config: MongoConfig,
+    cancel: threading.Event | None = None,
+) -> tuple[list[Entity], dict[str, int], SampleStore]:
     try:
         from pymongo import MongoClient
     except ModuleNotFoundError as exc:
         raise RuntimeError("Manca dipendenza pymongo. Installa con: pip install pymongo") from exc
+    if config.sample_binary not in {"stub", "drop"}:
+        raise ValueError(f"sample_binary MongoDB non valido: {config.sample_binary!r} (ammessi: stub, drop)")
+    if config.count_strategy not in COUNT_STRATEGIES:
+        raise ValueError(
+            f"count_strategy MongoDB non valida: {config.count_strategy!r} (ammesse: {', '.join(COUNT_STRATEGIES)})"
+        )
 
     client = MongoClient(config.uri)
-    db = client[config.dbname]
     entities: list[Entity] = []
     collection_counts: dict[str, int] = {}
-    samples_by_collection: dict[str, list[dict[str, Any]]] = {}
+    samples_by_collection = _sample_store(config, "mongo")
 
-    for collection_name in db.list_collection_names():
-        collection = db[collection_name]
-        collection_counts[collection_name] = int(collection.count_documents({}))
+    if config.all_databases:
+        dbnames = sorted(name for name in client.list_database_names() if name not in _MONGO_SYSTEM_DATABASES)
+    else:
+        dbnames = [config.dbname]
+    # Chiave di entità: nome collection, qualificato con il database solo in modalità multi-database.
+    targets: list[tuple[str, Any]] = []
+    for dbname in dbnames:
+        db = client[dbname]
+        for collection_name in sorted(db.list_collection_names()):
+            key = f"{dbname}.{collection_name}" if config.all_databases else collection_name
+            targets.append((key, db[collection_name]))
 
-        samples = list(collection.find({}, limit=config.sample_size))
-        all_keys: dict[str, list[Any]] = {}
-        for doc in samples:
-            for key, value in doc.items():
-                all_keys.setdefault(key, []).append(value)
+    # MongoClient è thread-safe: i worker condividono il suo pool di connessioni.
+    # I risultati seguono l'ordine dei target, quindi sono deterministici; il primo errore interrompe la discovery.
+    with ThreadPoolExecutor(max_workers=max(1, config.concurrency)) as executor:
+        stats = _map_fail_fast(executor, lambda target: _fetch_mongo_collection_stats(target[1]), targets)
+        indexes = _map_fail_fast(executor, lambda target: _fetch_mongo_indexes(target[1]), targets)
 
-        deep_samples = list(collection.find({}, limit=config.sample_records))
-        samples_by_collection[collection_name] = [_anonymize_document(doc) for doc in deep_samples]
+        # Collection invariate: fingerprint calcolato sulle statistiche attuali e sull'hash di schema salvato.
+        reused: dict[str, Entity] = {}
+        previous_samples = SampleStore()
+        if config.incremental:
+            previous_entities, previous_samples = _load_previous_discovery(config.previous_model_path)
+            for (key, _), target_stats in zip(targets, stats, strict=True):
+                previous = previous_entities.get(f"mg:{key}")
+                if previous is None or "row_count" not in previous.profile or f"mg:{key}" not in previous_samples:
+                    continue
+                fingerprint = _mongo_fingerprint(config, target_stats, previous.profile.get("schema_hash"))
+                if fingerprint is not None and previous.profile.get("fingerprint") == fingerprint:
+                    reused[key] = previous
 
-        attributes = [
-            Attribute(name=key, type=_infer_type(values), nullable=False, source="mongo")
-            for key, values in sorted(all_keys.items())
+        pending = [
+            (target, target_stats)
+            for target, target_stats in zip(targets, stats, strict=True)
+            if target[0] not in reused
         ]
+
+        def profile(item: tuple[tuple[str, Any], dict[str, Any]]) -> _CollectionProfile:
+            _check_cancelled(cancel)
+            (key, collection), target_stats = item
+            result = _profile_mongo_collection(collection, config, target_stats)
+            # Sink immediato: i campioni lasciano il worker appena prodotti.
+            samples_by_collection.put(key, result.samples)
+            result.samples = []
+            return result
+
+        keys = [target[0] for target, _ in pending]
+        profiled = dict(zip(keys, _map_fail_fast(executor, profile, pending), strict=True))
+
+    object_ids: dict[str, dict[str, list[Any]]] = {}
+    for (key, _), target_stats, target_indexes in zip(targets, stats, indexes, strict=True):
+        if key in reused:
+            previous = reused[key]
+            collection_counts[key] = int(previous.profile["row_count"])
+            samples_by_collection.put(key, previous_samples.get(f"mg:{key}", []))
+            previous.profile = {**previous.profile, "reused": True}
+            previous.profile.pop("profile_seconds", None)
+            previous.indexes = target_indexes
+            _apply_mongo_indexes(previous.attributes, target_indexes)
+            entities.append(previous)
+            continue
+        result = profiled[key]
+        object_ids[key] = result.object_ids
+        collection_counts[key] = result.count
+        _apply_mongo_indexes(result.attributes, target_indexes)
+        schema_hash = _mongo_schema_hash(result.attributes)
+        profile = {
+            "row_count": result.count,
+            "count_strategy": result.count_strategy,
+            "schema_hash": schema_hash,
+            "fingerprint": _mongo_fingerprint(config, target_stats, schema_hash),
+            "profile_seconds": round(result.seconds, 4),
+        }
+        if result.variants and "discriminator" in result.variants[0]:
+            profile["discriminator"] = result.variants[0]["discriminator"]
         entities.append(
             Entity(
-                id=f"mg:{collection_name}",
-                name=collection_name,
+                id=f"mg:{key}",
+                name=key,
                 source_system="mongo",
                 source_type="collection",
-                attributes=attributes,
+                attributes=result.attributes,
+                indexes=target_indexes,
+                profile=profile,
+                variants=result.variants,
             )
         )
+    if config.reference_detection:
+        _detect_mongo_references(entities, dict(targets), object_ids, config, cancel)
     return entities, collection_counts, samples_by_collection
 
 
+@dataclass
+class DiscoveryOptions:
+    # Esegue PostgreSQL e MongoDB in parallelo (server diversi): latenza ≈ la sorgente più lenta.
+    concurrent_sources: bool = False
+    # Tempo massimo complessivo delle sorgenti, in serie o in parallelo (0 = nessun limite).
+    # Le sorgenti non concluse entro la deadline vengono interrotte, escluse dal modello e segnalate nel log.
+    deadline_seconds: float = 0.0
+
+
+def _timed_discovery(
+    discover: Callable[..., Any],
+    config: Any,
+    cancel: threading.Event | None = None,
+) -> tuple[Any, float]:
+    started = time.perf_counter()
+    result = discover(config) if cancel is None else discover(config, cancel=cancel)
+    return result, time.perf_counter() - started
+
+
+def _submit_daemon(fn: Callable[..., Any], *args: Any) -> Future[Any]:
+    """Esegue `fn` in un thread daemon: una sorgente bloccata oltre la deadline non trattiene il processo."""
+    future: Future[Any] = Future()
+
+    def target() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=target, name="dmn-discovery-source", daemon=True).start()
+    return future
+
+
+def _run_discovery_sources(
+    sources: dict[str, tuple[Callable[..., Any], Any]],
+    options: DiscoveryOptions,
+) -> tuple[dict[str, tuple[Any, float]], list[str]]:
+    """Esegue le sorgenti in serie o in parallelo; restituisce risultati, tempi e sorgenti scadute.
+
+    Con una deadline ogni sorgente riceve un evento di cancellazione, controllato tra una
+    tabella/collection e l'altra: alla scadenza le sorgenti ancora attive si fermano e chiudono
+    le connessioni invece di proseguire in background.
+    """
+    concurrent = options.concurrent_sources and len(sources) > 1
+    if options.deadline_seconds <= 0 and not concurrent:
+        return {name: _timed_discovery(*source) for name, source in sources.items()}, []
+    cancel = threading.Event() if options.deadline_seconds > 0 else None
+    deadline = time.monotonic() + options.deadline_seconds if cancel is not None else None
+
+    def remaining() -> float | None:
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    futures: dict[str, Future[Any]] = {}
+    try:
+        if concurrent:
+            futures = {name: _submit_daemon(_timed_discovery, *source, cancel) for name, source in sources.items()}
+            wait(futures.values(), timeout=remaining())
+        else:
+            for name, source in sources.items():
+                if remaining() == 0.0:
+                    break
+                futures[name] = _submit_daemon(_timed_discovery, *source, cancel)
+                if not wait([futures[name]], timeout=remaining()).done:
+                    break
+    finally:
+        if cancel is not None:
+            cancel.set()
+    results = {
+        name: future.result()
+        for name, future in futures.items()
+        if future.done() and not isinstance(future.exception(), DiscoveryCancelled)
+    }
+    return results, [name for name in sources if name not in results]
+
+
 def discover_model(
     postgres: PostgresConfig | None,
     mongo: MongoConfig | None,
     llm_config: LLMConfig | None = None,
+    options: DiscoveryOptions | None = None,
 ) -> DataModel:
+    options = options or DiscoveryOptions()
     model = DataModel(metadata={"version": 1})
     discovery_log: list[str] = []
     source_counts: dict[str, dict[str, int]] = {}
-    deep_samples: dict[str, list[dict[str, Any]]] = {}
+    # Riferimenti ai campioni delle sorgenti: quelli già scritti su file non vengono riletti.
+    deep_samples = SampleStore()
 
+    sources: dict[str, tuple[Callable[[Any], Any], Any]] = {}
     if postgres is not None:
-        entities, table_counts, table_samples = discover_postgres(postgres)
+        sources["postgres"] = (discover_postgres, postgres)
+    if mongo is not None:
+        sources["mongo"] = (discover_mongo, mongo)
+    results, timed_out = _run_discovery_sources(sources, options)
+    if options.concurrent_sources and len(sources) > 1:
+        discovery_log.append(f"Discovery parallela di {len(sources)} sorgenti (PostgreSQL e MongoDB).")
+
+    # L'ordine delle entità resta PostgreSQL → MongoDB indipendentemente dall'ordine di completamento.
+    if "postgres" in results:
+        (entities, table_counts, table_samples), seconds = results["postgres"]
         model.entities.extend(entities)
         source_counts["postgres"] = table_counts
-        deep_samples.update({f"pg:{name}": docs for name, docs in table_samples.items()})
+        deep_samples.adopt(table_samples, prefix="pg:")
         discovery_log.append(f"Step 1/4 - Analizzate {len(table_counts)} tabelle SQL nel database PostgreSQL.")
+        reused = sum(1 for entity in entities if entity.profile.get("reused"))
+        if reused:
+            discovery_log.append(
+                f"Discovery incrementale PostgreSQL: {reused} tabelle invariate riutilizzate dal modello precedente."
+            )
+        discovery_log.append(f"Tempo discovery PostgreSQL: {seconds:.2f} s.")
 
-    if mongo is not None:
-        entities, collection_counts, collection_samples = discover_mongo(mongo)
+    if "mongo" in results:
+        (entities, collection_counts, collection_samples), seconds = results["mongo"]
         model.entities.extend(entities)
         source_counts["mongo"] = collection_counts
-        deep_samples.update({f"mg:{name}": docs for name, docs in collection_samples.items()})
-        discovery_log.append(f"Step 2/4 - Analizzate {len(collection_counts)} collection MongoDB nel database.")
+        deep_samples.adopt(collection_samples, prefix="mg:")
+        scope = "in tutti i database del cluster" if mongo.all_databases else "nel database"
+        discovery_log.append(f"Step 2/4 - Analizzate {len(collection_counts)} collection MongoDB {scope}.")
+        reused = sum(1 for entity in entities if entity.profile.get("reused"))
+        if reused:
+            discovery_log.append(
+                f"Discovery incrementale MongoDB: {reused} collection invariate riutilizzate dal modello precedente."
+            )
+        discovery_log.append(f"Tempo discovery MongoDB: {seconds:.2f} s.")
+
+    if results:
+        model.metadata["discovery_source_seconds"] = {name: round(result[1], 4) for name, result in results.items()}
+    if timed_out:
+        model.metadata["discovery_timed_out"] = timed_out
+        discovery_log.append(
+            f"Deadline di {options.deadline_seconds:g} s superata: "
+            f"sorgenti escluse dal modello: {', '.join(timed_out)}."
+        )
+
+    declared = declared_relationships(model)
+    if declared:
+        model.relationships.extend(declared)
+        detected = sum(1 for rel in declared if rel.source == "detected")
+        if len(declared) > detected:
+            discovery_log.append(
+                f"Importate {len(declared) - detected} relazioni dichiarate (foreign key) dal catalogo."
+            )
+        if detected:
+            discovery_log.append(f"Rilevati {detected} riferimenti ObjectId verificati sugli `_id` delle collection.")
 
     if source_counts:
+        strategies = {entity.id: entity.profile.get("count_strategy") for entity in model.entities}
         counts_lines = []
         for source_name, items in source_counts.items():
+            prefix = SOURCE_PREFIXES[source_name]
             for name, count in sorted(items.items()):
-                counts_lines.append(f"{source_name}.{name}: {count} record")
+                line = f"{source_name}.{name}: {count} record"
+                strategy = strategies.get(f"{prefix}:{name}")
+                if strategy:
+                    line += f" ({COUNT_STRATEGY_LABELS.get(strategy, strategy)})"
+                counts_lines.append(line)
         model.metadata["discovery_count_log"] = counts_lines
-        discovery_log.append("Step 3/4 - Completata interrogazione COUNT(*)/count_documents per ogni entità.")
+        discovery_log.append("Step 3/4 - Completato conteggio record (COUNT(*)/count_documents o stima da catalogo) per ogni entità.")
 
     if llm_config is not None and llm_config.user_prompt.strip():
         guidance = apply_llm_guidance(model.entities, llm_config)
@@ -246,26 +1700,65 @@ def discover_model(
         model.metadata["llm_batches"] = len(guidance.raw_responses)
 
         sample_insights: dict[str, list[str]] = {}
-        for entity in model.entities:
+        reductions: dict[str, dict[str, int]] = {}
+        limiter = RateLimiter(llm_config.requests_per_minute, llm_config.tokens_per_minute)
+
+        def analyze(entity: Entity) -> list[str]:
+            # I campioni sono letti qui (eventualmente da file) per tenerne in memoria pochi alla volta.
             samples = deep_samples.get(entity.id, [])
             if not samples:
-                continue
-            insights = analyze_entity_samples(
+                return []
+            reduction = reduce_samples(samples)
+            reductions[entity.id] = reduction.report()
+            return analyze_entity_samples(
                 entity_name=entity.name,
                 entity_source=entity.source_system,
-                samples=samples,
+                samples=reduction,
                 config=llm_config,
+                limiter=limiter,
             )
-            if insights:
-                sample_insights[entity.id] = insights
+
+        # Le chiamate HTTP bloccanti girano in parallelo; i risultati seguono l'ordine delle entità.
+        with ThreadPoolExecutor(max_workers=max(1, llm_config.sample_concurrency)) as executor:
+            futures = [(entity.id, executor.submit(analyze, entity)) for entity in model.entities]
+            for entity_id, future in futures:
+                insights = future.result()
+                if insights:
+                    sample_insights[entity_id] = insights
+        reductions = {entity.id: reductions[entity.id] for entity in model.entities if entity.id in reductions}
+        if reductions:
+            model.metadata["llm_sample_reduction"] = reductions
+            saved = sum(report["estimated_tokens_saved"] for report in reductions.values())
+            before = sum(report["estimated_tokens_before"] for report in reductions.values())
+            if saved > 0:
+                discovery_log.append(
+                    f"Deduplicazione campioni per LLM: risparmiati circa {saved} token su {before} stimati."
+                )
         if sample_insights:
             model.metadata["llm_sample_insights"] = sample_insights
             discovery_log.append(
                 "Step 4/4 - Eseguita deep discovery su record anonimizzati con supporto LLM."
             )
 
-    if deep_samples:
-        model.metadata["deep_discovery_samples"] = deep_samples
+    timings = {
+        entity.id: entity.profile["profile_seconds"]
+        for entity in model.entities
+        if "profile_seconds" in entity.profile
+    }
+    if timings:
+        model.metadata["discovery_timings"] = timings
+        if postgres is not None:
+            model.metadata["postgres_pool_size"] = max(1, postgres.pool_size)
+        if mongo is not None:
+            model.metadata["mongo_concurrency"] = max(1, mongo.concurrency)
+
+    if deep_samples.in_memory():
+        model.metadata["deep_discovery_samples"] = deep_samples.in_memory()
+    if deep_samples.spilled():
+        model.metadata["deep_discovery_sample_files"] = deep_samples.spilled()
+        discovery_log.append(
+            f"Campioni di {len(deep_samples.spilled())} entità scritti su file per rispettare il budget di memoria."
+        )
     model.metadata["discovery_log"] = discovery_log
 
     return model
@@ -10,6 +10,12 @@ class Attribute:
     type: str
     nullable: bool = True
     source: str = ""
+    primary_key: bool = False
+    unique: bool = False
+    # Riferimento dichiarato (FK) nel formato "<entity_id>.<campo>", es. "pg:customers.id".
+    references: str = ""
+    # Profilo statistico del campo (es. null_frac, n_distinct da pg_stats).
+    stats: dict[str, Any] = field(default_factory=dict)
 
 
 @dataclass
@@ -20,6 +26,10 @@ class Entity:
     source_type: str
     attributes: list[Attribute] = field(default_factory=list)
     tags: list[str] = field(default_factory=list)
+    indexes: list[dict[str, Any]] = field(default_factory=list)
+    profile: dict[str, Any] = field(default_factory=dict)
+    # Varianti strutturali (es. documenti Mongo con campo discriminante), con frequenza e sotto-schema.
+    variants: list[dict[str, Any]] = field(default_factory=list)
 
 
 @dataclass
@@ -52,6 +62,9 @@ class DataModel:
                 source_type=e["source_type"],
                 attributes=[Attribute(**a) for a in e.get("attributes", [])],
                 tags=e.get("tags", []),
+                indexes=e.get("indexes", []),
+                profile=e.get("profile", {}),
+                variants=e.get("variants", []),
             )
             for e in payload.get("entities", [])
         ]
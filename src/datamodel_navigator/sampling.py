@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from collections.abc import Iterable, Iterator, Mapping
+from pathlib import Path
+from typing import Any
+
+
+class SampleStore(Mapping[str, list[dict[str, Any]]]):
+    """Campioni per entità con budget di memoria condiviso.
+
+    Finché il budget lo consente i campioni restano in memoria; oltre, ogni entità viene scritta
+    record per record in un file JSONL laterale e riletta solo quando serve (`store[key]`).
+    Thread-safe: i worker di discovery possono scrivere entità diverse in parallelo.
+    """
+
+    def __init__(self, memory_budget_bytes: int | None = None, spill_dir: str | Path | None = None) -> None:
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self._memory: dict[str, list[dict[str, Any]]] = {}
+        self._sizes: dict[str, int] = {}
+        self._files: dict[str, str] = {}
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_metadata(cls, inline: Mapping[str, list[dict[str, Any]]], files: Mapping[str, str]) -> SampleStore:
+        """Ricostruisce lo store da `deep_discovery_samples` e `deep_discovery_sample_files` di un modello.
+
+        I file laterali non più presenti (es. cartella dei campioni ripulita) vengono ignorati: le
+        entità corrispondenti risultano senza campioni.
+        """
+        store = cls()
+        store._memory = dict(inline)
+        store._files = {
+            key: path for key, path in files.items() if key not in store._memory and Path(path).is_file()
+        }
+        return store
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._used
+
+    def put(self, key: str, samples: Iterable[dict[str, Any]]) -> None:
+        """Consuma i campioni in streaming: in memoria entro il budget, altrimenti su file."""
+        self._discard(key)
+        records: list[dict[str, Any]] = []
+        reserved = 0
+        handle = None
+        try:
+            for record in samples:
+                line = json.dumps(record, ensure_ascii=False, default=str)
+                if handle is None and self._reserve(len(line)):
+                    records.append(record)
+                    reserved += len(line)
+                    continue
+                if handle is None:
+                    # Budget esaurito: i record già accumulati passano su file e la memoria si libera.
+                    handle = self._open_spill(key)
+                    for kept in records:
+                        handle.write(json.dumps(kept, ensure_ascii=False, default=str) + "\n")
+                    records = []
+                    self._release(reserved)
+                    reserved = 0
+                handle.write(line + "\n")
+        finally:
+            if handle is not None:
+                handle.close()
+        with self._lock:
+            if handle is None:
+                self._memory[key] = records
+                self._sizes[key] = reserved
+            else:
+                self._files[key] = handle.name
+
+    def adopt(self, other: Mapping[str, list[dict[str, Any]]], prefix: str = "") -> None:
+        """Aggiunge i campioni di un altro store senza rileggere i file già scritti."""
+        if not isinstance(other, SampleStore):
+            for key, samples in other.items():
+                self.put(f"{prefix}{key}", samples)
+            return
+        with self._lock:
+            for key, samples in other._memory.items():
+                self._memory[f"{prefix}{key}"] = samples
+                self._sizes[f"{prefix}{key}"] = other._sizes.get(key, 0)
+                self._used += other._sizes.get(key, 0)
+            for key, path in other._files.items():
+                self._files[f"{prefix}{key}"] = path
+
+    def in_memory(self) -> dict[str, list[dict[str, Any]]]:
+        return dict(self._memory)
+
+    def spilled(self) -> dict[str, str]:
+        return dict(self._files)
+
+    def __getitem__(self, key: str) -> list[dict[str, Any]]:
+        if key in self._memory:
+            return self._memory[key]
+        if key in self._files:
+            try:
+                with open(self._files[key], encoding="utf-8") as handle:
+                    return [json.loads(line) for line in handle if line.strip()]
+            except FileNotFoundError:
+                raise KeyError(key) from None
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([*self._memory, *self._files])
+
+    def __len__(self) -> int:
+        return len(self._memory) + len(self._files)
+
+    def _reserve(self, size: int) -> bool:
+        with self._lock:
+            # Senza cartella di spill il budget non può essere rispettato: si resta in memoria.
+            over_budget = self.memory_budget_bytes is not None and self._used + size > self.memory_budget_bytes
+            if over_budget and self.spill_dir is not None:
+                return False
+            self._used += size
+            return True
+
+    def _release(self, size: int) -> None:
+        with self._lock:
+            self._used -= size
+
+    def _discard(self, key: str) -> None:
+        with self._lock:
+            if key in self._memory:
+                del self._memory[key]
+                self._used -= self._sizes.pop(key, 0)
+            self._files.pop(key, None)
+
+    def _open_spill(self, key: str) -> Any:
+        assert self.spill_dir is not None
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        safe = re.sub(r"[^\w.-]", "_", key)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+        return open(self.spill_dir / f"{safe}-{digest}.jsonl", "w", encoding="utf-8")
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import hashlib
+import math
+from collections import Counter
+from typing import Any, Callable
+
+from datamodel_navigator.anonymization import Anonymizer
+from datamodel_navigator.models import Attribute
+
+
+class _PathNode:
+    """Contatori di un percorso: nessun valore campione viene trattenuto."""
+
+    __slots__ = ("types", "documents", "last_document", "array_min", "array_max", "array_total", "array_count", "children")
+
+    def __init__(self) -> None:
+        self.types: Counter[str] = Counter()
+        self.documents = 0
+        self.last_document = -1
+        self.array_min = 0
+        self.array_max = 0
+        self.array_total = 0
+        self.array_count = 0
+        self.children: dict[str, _PathNode] = {}
+
+    def observe(self, type_name: str, value: Any, document: int) -> None:
+        self.types[type_name] += 1
+        if self.last_document != document:
+            # Presenza contata una volta per documento, anche dentro gli array.
+            self.last_document = document
+            self.documents += 1
+        if isinstance(value, list):
+            length = len(value)
+            if self.array_count == 0:
+                self.array_min = self.array_max = length
+            else:
+                self.array_min = min(self.array_min, length)
+                self.array_max = max(self.array_max, length)
+            self.array_total += length
+            self.array_count += 1
+
+
+class SchemaTrie:
+    """Inferenza di schema in streaming su documenti annidati.
+
+    Ogni documento aggiorna contatori di tipo, presenza e lunghezza array per percorso
+    (`address.city`, `items[].sku`): la memoria dipende dal numero di percorsi distinti,
+    non dal numero di documenti osservati.
+    """
+
+    def __init__(self, max_depth: int = 8, type_name: Callable[[Any], str] | None = None) -> None:
+        self.max_depth = max_depth
+        self._type_name = type_name or (lambda value: type(value).__name__)
+        self.documents = 0
+        self._root: dict[str, _PathNode] = {}
+
+    def add(self, document: dict[str, Any]) -> None:
+        document_index = self.documents
+        self.documents += 1
+        # Visita iterativa: nessun limite di ricorsione sui documenti molto annidati.
+        stack: list[tuple[dict[str, _PathNode], str, Any, int]] = [
+            (self._root, key, value, 1) for key, value in document.items()
+        ]
+        while stack:
+            siblings, key, value, depth = stack.pop()
+            node = siblings.get(key)
+            if node is None:
+                node = siblings[key] = _PathNode()
+            node.observe(self._type_name(value), value, document_index)
+            if depth >= self.max_depth:
+                continue
+            if isinstance(value, dict):
+                stack.extend((node.children, child_key, child, depth + 1) for child_key, child in value.items())
+            elif isinstance(value, list):
+                stack.extend((node.children, "[]", item, depth + 1) for item in value)
+
+    def attributes(self, source: str = "") -> list[Attribute]:
+        attributes: list[Attribute] = []
+        stack: list[tuple[str, dict[str, _PathNode]]] = [("", self._root)]
+        while stack:
+            prefix, siblings = stack.pop()
+            for key, node in siblings.items():
+                if key == "[]":
+                    path = f"{prefix}[]"
+                else:
+                    path = f"{prefix}.{key}" if prefix else key
+                attributes.append(self._attribute(path, node, source))
+                if node.children:
+                    stack.append((path, node.children))
+        return sorted(attributes, key=lambda attr: attr.name)
+
+    def _attribute(self, path: str, node: _PathNode, source: str) -> Attribute:
+        present = {name: count for name, count in node.types.items() if name != "NoneType"}
+        presence = round(node.documents / self.documents, 4) if self.documents else 0.0
+        stats: dict[str, Any] = {"presence_ratio": presence, "types": dict(sorted(node.types.items()))}
+        if node.array_count:
+            stats["array_length"] = {
+                "min": node.array_min,
+                "max": node.array_max,
+                "avg": round(node.array_total / node.array_count, 2),
+            }
+        return Attribute(
+            name=path,
+            type=max(present.items(), key=lambda item: item[1])[0] if present else "unknown",
+            nullable=presence < 1 or "NoneType" in node.types,
+            source=source,
+            stats=stats,
+        )
+
+
+class ShapeClusterer:
+    """Raggruppa in streaming i documenti per forma (insieme delle chiavi di primo livello).
+
+    Per ogni documento aggiorna solo contatori per firma e per coppia (campo, valore): il costo è
+    lineare nel numero di documenti. Alla fine il campo discriminante è quello i cui valori
+    spiegano meglio le firme (informazione mutua normalizzata sull'entropia delle firme).
+    I valori del discriminante finiscono nel modello: con un `anonymizer` i campi personali (per
+    nome o per valore) non sono mai candidati.
+    """
+
+    _DISCRIMINATOR_TYPES = (str, int, bool)
+
+    def __init__(
+        self,
+        max_discriminator_values: int = 20,
+        min_score: float = 0.5,
+        anonymizer: Anonymizer | None = None,
+    ) -> None:
+        self.max_discriminator_values = max_discriminator_values
+        self.min_score = min_score
+        self.anonymizer = anonymizer
+        self.documents = 0
+        self._signatures: Counter[tuple[str, ...]] = Counter()
+        self._types: dict[tuple[str, ...], dict[str, Counter[str]]] = {}
+        # campo -> valore -> firma -> documenti; None quando il campo ha troppi valori distinti.
+        self._candidates: dict[str, dict[Any, Counter[tuple[str, ...]]] | None] = {}
+
+    def add(self, document: dict[str, Any]) -> None:
+        self.documents += 1
+        signature = tuple(sorted(document))
+        self._signatures[signature] += 1
+        types = self._types.setdefault(signature, {})
+        for key, value in document.items():
+            types.setdefault(key, Counter())[type(value).__name__] += 1
+            if key == "_id":
+                continue
+            values = self._candidates.get(key, {})
+            if values is None:
+                continue
+            if (
+                not isinstance(value, self._DISCRIMINATOR_TYPES)
+                or (value not in values and len(values) >= self.max_discriminator_values)
+                or self._is_personal(key, value)
+            ):
+                self._candidates[key] = None
+                continue
+            values.setdefault(value, Counter())[signature] += 1
+            self._candidates[key] = values
+
+    def _is_personal(self, key: str, value: Any) -> bool:
+        if self.anonymizer is None:
+            return False
+        return self.anonymizer.is_personal_key(key) or self.anonymizer.is_personal_value(value)
+
+    def discriminator(self) -> str:
+        """Campo discriminante, o stringa vuota se nessun campo separa le forme."""
+        signature_entropy = self._entropy(self._signatures.values())
+        if signature_entropy == 0:
+            return ""
+        best = ("", 0.0)
+        for key, values in sorted(self._candidates.items()):
+            if values is None or len(values) < 2:
+                continue
+            present = sum(sum(by_signature.values()) for by_signature in values.values())
+            if present < self.documents * 0.95:
+                continue
+            # I(V;S) = H(S) - H(S|V), calcolata sui documenti in cui il campo è presente.
+            conditional = sum(
+                sum(by_signature.values()) / present * self._entropy(by_signature.values())
+                for by_signature in values.values()
+            )
+            score = (signature_entropy - conditional) / signature_entropy
+            if score >= self.min_score and score > best[1]:
+                best = (key, score)
+        return best[0]
+
+    def variants(self, max_variants: int = 10) -> list[dict[str, Any]]:
+        """Varianti con frequenza e sotto-schema: per valore del discriminante o, in sua assenza, per firma."""
+        if len(self._signatures) < 2:
+            return []
+        discriminator = self.discriminator()
+        if discriminator:
+            groups = [
+                (value, by_signature)
+                for value, by_signature in (self._candidates[discriminator] or {}).items()
+            ]
+        else:
+            groups = [(None, Counter({signature: count})) for signature, count in self._signatures.items()]
+        groups.sort(key=lambda group: (-sum(group[1].values()), str(group[0]), sorted(group[1])))
+
+        variants: list[dict[str, Any]] = []
+        for value, by_signature in groups[:max_variants]:
+            documents = sum(by_signature.values())
+            variant: dict[str, Any] = {
+                "signature": self._signature_hash(sorted(by_signature)),
+                "documents": documents,
+                "frequency": round(documents / self.documents, 4),
+                "attributes": self._variant_attributes(by_signature, documents),
+            }
+            if discriminator:
+                variant = {"discriminator": discriminator, "value": value, **variant}
+            variants.append(variant)
+        return variants
+
+    def _variant_attributes(self, by_signature: Counter[tuple[str, ...]], documents: int) -> list[dict[str, Any]]:
+        presence: Counter[str] = Counter()
+        types: dict[str, Counter[str]] = {}
+        for signature, count in by_signature.items():
+            for key in signature:
+                presence[key] += count
+                types.setdefault(key, Counter()).update(self._types[signature][key])
+        return [
+            {
+                "name": key,
+                "type": types[key].most_common(1)[0][0],
+                "presence_ratio": round(presence[key] / documents, 4),
+            }
+            for key in sorted(presence)
+        ]
+
+    @staticmethod
+    def _entropy(counts: Any) -> float:
+        counts = list(counts)
+        total = sum(counts)
+        return -sum(count / total * math.log2(count / total) for count in counts if count) if total else 0.0
+
+    @staticmethod
+    def _signature_hash(signatures: list[tuple[str, ...]]) -> str:
+        encoded = "|".join(",".join(signature) for signature in signatures).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()[:12]
@@ -0,0 +1,65 @@
+from datamodel_navigator.anonymization import Anonymizer, benchmark
+
+
+def test_anonymize_document_masks_personal_data() -> None:
+    payload = {
+        "name": "Mario Rossi",
+        "email": "mario@example.com",
+        "amount": 99.5,
+        "profile": {"phone": "123", "city": "Roma"},
+    }
+
+    masked = Anonymizer().anonymize(payload)
+
+    assert masked["name"] == "***"
+    assert masked["email"] == "***"
+    assert masked["amount"] == 99.5
+    assert masked["profile"]["phone"] == "***"
+    assert masked["profile"]["city"] == "***"
+
+
+def test_custom_rules_mask_keys_and_values_without_touching_input() -> None:
+    anonymizer = Anonymizer(
+        extra_markers=("iban",),
+        key_patterns=(r"^cf$",),
+        value_patterns=(r"[\w.+-]+@[\w-]+\.[\w.]+",),
+        allowed_keys=("filename",),
+    )
+    payload = {
+        "filename": "report.pdf",
+        "cf": "RSSMRA80A01H501U",
+        "payment": {"IBAN_code": "IT60X0542811101000000123456", "cfg": 1},
+        "notes": ["chiamare", "scrivere a mario@example.com", {"contact": {"age": 40, "ok": True}}],
+        "customer": {"name": {"first": "Mario", "age": 40, "vip": True}},
+    }
+
+    masked = anonymizer.anonymize(payload)
+
+    assert masked == {
+        "filename": "report.pdf",
+        "cf": "***",
+        "payment": {"IBAN_code": "***", "cfg": 1},
+        "notes": ["chiamare", "***", {"contact": {"age": 40, "ok": True}}],
+        "customer": {"name": {"first": "***", "age": 0, "vip": True}},
+    }
+    assert payload["cf"] == "RSSMRA80A01H501U"
+
+
+def test_anonymize_handles_documents_deeper_than_the_recursion_limit() -> None:
+    document: dict = {"email": "a@b.c"}
+    for _ in range(5_000):
+        document = {"child": [document]}
+
+    masked = Anonymizer().anonymize(document)
+
+    for _ in range(5_000):
+        masked = masked["child"][0]
+    assert masked == {"email": "***"}
+
+
+def test_benchmark_reports_throughput() -> None:
+    result = benchmark(documents=200)
+
+    assert result["documents"] == 200
+    assert result["values"] == 200 * 24
+    assert result["values_per_second"] > 0
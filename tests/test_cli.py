@@ -52,10 +52,11 @@ def test_phase_discovery_uses_saved_config_without_prompting(monkeypatch, tmp_pa
 
     captured = {}
 
-    def fake_discover_model(pg, mg, llm_config=None):
+    def fake_discover_model(pg, mg, llm_config=None, options=None):
         captured["pg"] = pg
         captured["mg"] = mg
         captured["llm"] = llm_config
+        captured["options"] = options
 
         class DummyModel:
             pass
@@ -74,6 +75,7 @@ def test_phase_discovery_uses_saved_config_without_prompting(monkeypatch, tmp_pa
     assert captured["mg"] is None
     assert captured["llm"] is not None
     assert captured["llm"].api_key == "token-123"
+    assert captured["options"].concurrent_sources is False
 
 
 def test_phase_fix_json_model_applies_llm_corrections(monkeypatch, tmp_path: Path) -> None:
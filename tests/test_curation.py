@@ -1,4 +1,4 @@
-from datamodel_navigator.curation import auto_cleanup, suggest_relationships
+from datamodel_navigator.curation import auto_cleanup, declared_relationships, indexed_fields, suggest_relationships
 from datamodel_navigator.models import Attribute, DataModel, Entity
 
 
@@ -45,3 +45,88 @@ def test_suggest_relationships_from_suffix_id() -> None:
     assert len(rels) == 1
     assert rels[0].from_entity == "pg:orders"
     assert rels[0].to_entity == "pg:customer"
+
+
+def test_suggest_relationships_skips_declared_references() -> None:
+    model = DataModel(
+        entities=[
+            Entity(
+                id="pg:orders",
+                name="orders",
+                source_system="postgres",
+                source_type="table",
+                attributes=[
+                    Attribute(name="customer_id", type="uuid", nullable=False, references="pg:customer.id"),
+                ],
+            ),
+            Entity(
+                id="pg:customer",
+                name="customer",
+                source_system="postgres",
+                source_type="table",
+                attributes=[Attribute(name="id", type="uuid", nullable=False, primary_key=True)],
+            ),
+        ]
+    )
+
+    declared = declared_relationships(model)
+    model.relationships.extend(declared)
+
+    assert [(r.id, r.confidence, r.source) for r in declared] == [
+        ("rel:pg:orders:customer_id->pg:customer:id", 1.0, "declared")
+    ]
+    assert suggest_relationships(model) == []
+
+
+def test_suggest_relationships_uses_column_statistics() -> None:
+    model = DataModel(
+        entities=[
+            Entity(
+                id="pg:orders",
+                name="orders",
+                source_system="postgres",
+                source_type="table",
+                attributes=[
+                    Attribute(name="customer_id", type="int", stats={"null_frac": 0.0, "distinct_estimate": 80}),
+                    Attribute(name="region_id", type="int", stats={"null_frac": 0.0, "distinct_estimate": 5000}),
+                ],
+            ),
+            Entity(
+                id="pg:customer",
+                name="customer",
+                source_system="postgres",
+                source_type="table",
+                attributes=[Attribute(name="id", type="int", primary_key=True, stats={"distinct_estimate": 100})],
+            ),
+            Entity(
+                id="pg:region",
+                name="region",
+                source_system="postgres",
+                source_type="table",
+                attributes=[Attribute(name="id", type="int", primary_key=True, stats={"distinct_estimate": 20})],
+            ),
+        ]
+    )
+
+    confidence = {r.to_entity: r.confidence for r in suggest_relationships(model)}
+
+    assert confidence == {"pg:customer": 0.8, "pg:region": 0.5}
+
+
+def test_suggest_relationships_prefers_indexed_reference_fields() -> None:
+    orders = Entity(
+        id="mg:orders",
+        name="orders",
+        source_system="mongo",
+        source_type="collection",
+        attributes=[Attribute(name="customer_id", type="ObjectId"), Attribute(name="productId", type="ObjectId")],
+        indexes=[{"name": "customer_id_1", "columns": ["customer_id"], "unique": False, "primary": False}],
+    )
+    customer = Entity(id="mg:customer", name="customer", source_system="mongo", source_type="collection")
+    product = Entity(id="mg:product", name="product", source_system="mongo", source_type="collection")
+    model = DataModel(entities=[orders, customer, product])
+
+    confidence = {r.to_entity: r.confidence for r in suggest_relationships(model)}
+
+    assert indexed_fields(orders) == {"customer_id"}
+    assert confidence == {"mg:customer": 0.75, "mg:product": 0.55}
@@ -3,23 +3,6 @@ from datamodel_navigator.llm_guidance import LLMConfig
 from datamodel_navigator.models import Attribute, Entity
 
 
-def test_anonymize_document_masks_personal_data() -> None:
-    payload = {
-        "name": "Mario Rossi",
-        "email": "mario@example.com",
-        "amount": 99.5,
-        "profile": {"phone": "123", "city": "Roma"},
-    }
-
-    masked = discovery._anonymize_document(payload)
-
-    assert masked["name"] == "***"
-    assert masked["email"] == "***"
-    assert masked["amount"] == 99.5
-    assert masked["profile"]["phone"] == "***"
-    assert masked["profile"]["city"] == "***"
-
-
 def test_discover_model_adds_discovery_logs_and_counts(monkeypatch) -> None:
     def fake_discover_postgres(_config):
         return (
@@ -84,3 +67,962 @@ def test_discover_model_runs_deep_llm_insights(monkeypatch) -> None:
 
     assert model.metadata["llm_sample_insights"]["pg:orders"]
     assert any("deep discovery" in step.lower() for step in model.metadata["discovery_log"])
+
+
+class _FakeComposed:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def format(self, *parts, **named) -> "_FakeComposed":
+        return _FakeComposed(
+            self.text.format(*(part.text for part in parts), **{key: part.text for key, part in named.items()})
+        )
+
+    def join(self, parts) -> "_FakeComposed":
+        return _FakeComposed(self.text.join(part.text for part in parts))
+
+
+class _FakeLiteral(_FakeComposed):
+    def __init__(self, value) -> None:
+        super().__init__(str(value))
+
+
+class _FakeIdentifier(_FakeComposed):
+    def __init__(self, name: str) -> None:
+        super().__init__(f'"{name}"')
+
+
+class _FakeColumn:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class _FakeCursor:
+    def __init__(self, handler) -> None:
+        self._handler = handler
+        self._rows: list = []
+        self.description: list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        return None
+
+    def execute(self, query, params=None) -> None:
+        text = query.text if isinstance(query, _FakeComposed) else query
+        columns, self._rows = self._handler(" ".join(text.split()), params)
+        self.description = [_FakeColumn(name) for name in columns]
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return iter(list(self._rows))
+
+
+class _FakeConnection:
+    def __init__(self, handler, opened: list) -> None:
+        self._handler = handler
+        opened.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        return None
+
+    def cursor(self, name=None):
+        return _FakeCursor(self._handler)
+
+    def close(self) -> None:
+        return None
+
+
+def _install_fake_psycopg(monkeypatch, handler) -> list:
+    import sys
+    import types
+
+    opened: list = []
+    sql_module = types.SimpleNamespace(SQL=_FakeComposed, Identifier=_FakeIdentifier, Literal=_FakeLiteral)
+    fake = types.SimpleNamespace(connect=lambda **_kwargs: _FakeConnection(handler, opened), sql=sql_module)
+    monkeypatch.setitem(sys.modules, "psycopg", fake)
+    return opened
+
+
+def _orders_catalog_handler(query: str, params):
+    if "information_schema.columns" in query:
+        rows = [(table, "id", "integer", "NO") for table in ("a_orders", "b_items", "c_users")]
+        return ["table_name", "column_name", "data_type", "is_nullable"], rows
+    if query.startswith("SELECT COUNT(*)"):
+        return ["count"], [(len(query),)]
+    if query.startswith("SELECT ") and query.endswith("LIMIT %s"):
+        return ["id", "email"], [(1, "x@example.com")]
+    return [], []
+
+
+def test_discover_postgres_parallel_pool_keeps_catalog_order(monkeypatch) -> None:
+    opened = _install_fake_psycopg(monkeypatch, _orders_catalog_handler)
+
+    serial = discovery.discover_postgres(discovery.PostgresConfig())
+    parallel = discovery.discover_postgres(discovery.PostgresConfig(pool_size=2))
+
+    assert [e.name for e in parallel[0]] == ["a_orders", "b_items", "c_users"]
+    assert parallel[1] == serial[1]
+    assert parallel[2] == serial[2]
+    assert parallel[2]["a_orders"] == [{"id": 1, "email": "***"}]
+    assert all("profile_seconds" in e.profile for e in parallel[0])
+    # 1 connessione per la discovery seriale; in parallelo il catalogo è la prima delle 2 del pool.
+    assert 2 <= len(opened) <= 3
+
+
+def test_postgres_pool_counts_initial_connection_in_size() -> None:
+    opened: list = []
+    catalog = _FakeConnection(None, [])
+    pool = discovery._PostgresConnectionPool(lambda: _FakeConnection(None, opened), 2, initial=catalog)
+
+    with pool.connection() as first, pool.connection() as second:
+        assert first is catalog
+        assert second is not catalog
+    pool.close()
+
+    assert len(opened) == 1
+
+
+def test_discover_model_reports_per_table_timings(monkeypatch) -> None:
+    _install_fake_psycopg(monkeypatch, _orders_catalog_handler)
+
+    model = discovery.discover_model(discovery.PostgresConfig(pool_size=3), mongo=None)
+
+    assert set(model.metadata["discovery_timings"]) == {"pg:a_orders", "pg:b_items", "pg:c_users"}
+    assert model.metadata["postgres_pool_size"] == 3
+
+
+def test_discover_postgres_pool_stops_at_the_first_failing_table(monkeypatch) -> None:
+    import pytest
+
+    tables = [f"t{i:03d}" for i in range(200)]
+    counted: list[str] = []
+
+    def handler(query: str, params):
+        if "information_schema.columns" in query:
+            return ["table_name", "column_name", "data_type", "is_nullable"], [(t, "id", "integer", "NO") for t in tables]
+        if query.startswith("SELECT COUNT(*)"):
+            table = query.split('"public"."')[1].rstrip('"')
+            counted.append(table)
+            if table == "t001":
+                raise PermissionError("permission denied for table t001")
+            return ["count"], [(1,)]
+        return [], []
+
+    _install_fake_psycopg(monkeypatch, handler)
+
+    with pytest.raises(PermissionError):
+        discovery.discover_postgres(discovery.PostgresConfig(pool_size=2, sample_records=0))
+
+    assert len(counted) < len(tables)
+
+
+def test_estimate_row_count_scales_reltuples_to_current_pages() -> None:
+    assert discovery._estimate_row_count({"reltuples": 1000.0, "relpages": 10, "current_pages": 20}) == 2000
+    assert discovery._estimate_row_count({"reltuples": -1.0, "relpages": 0, "n_live_tup": 37}) == 37
+    assert discovery._estimate_row_count({"reltuples": -1.0, "relpages": 0, "n_live_tup": None}) is None
+
+
+def test_hybrid_strategy_counts_exactly_only_below_threshold() -> None:
+    assert discovery._resolve_count_strategy("hybrid", 10, threshold=100) == "exact"
+    assert discovery._resolve_count_strategy("hybrid", 1000, threshold=100) == "estimate"
+    assert discovery._resolve_count_strategy("estimate", None, threshold=100) == "exact"
+
+
+def test_discover_postgres_estimate_strategy_skips_count_scans(monkeypatch) -> None:
+    executed: list[str] = []
+
+    def handler(query: str, params):
+        executed.append(query)
+        if "FROM pg_class" in query:
+            return ["relname"], [("a_orders", "r", 500.0, 5, 5, 480)]
+        return _orders_catalog_handler(query, params)
+
+    _install_fake_psycopg(monkeypatch, handler)
+
+    model = discovery.discover_model(discovery.PostgresConfig(count_strategy="estimate"), mongo=None)
+
+    assert sum(q.startswith("SELECT COUNT(*)") for q in executed) == 2
+    assert "postgres.a_orders: 500 record (stima da metadati)" in model.metadata["discovery_count_log"]
+    assert "postgres.b_items: 39 record (conteggio esatto)" in model.metadata["discovery_count_log"]
+
+
+def test_tablesample_percent_targets_sample_size() -> None:
+    assert discovery._tablesample_percent(50, 10_000_000) == 0.001
+    assert discovery._tablesample_percent(50, 40) == 100.0
+    assert discovery._tablesample_percent(50, None) is None
+
+
+def test_tablesample_falls_back_to_limit_for_views_and_foreign_tables() -> None:
+    import types
+
+    sql = types.SimpleNamespace(SQL=_FakeComposed, Identifier=_FakeIdentifier, Literal=_FakeLiteral)
+    config = discovery.PostgresConfig(sample_method="bernoulli", sample_records=10)
+
+    table_query, table_params, table_method = discovery._build_sample_query(sql, config, "events", "r", 100_000)
+    view_query, view_params, view_method = discovery._build_sample_query(sql, config, "v_events", "v", 100_000)
+    _, _, foreign_method = discovery._build_sample_query(sql, config, "remote", "f", 100_000)
+
+    assert table_method == "bernoulli"
+    assert 'FROM "public"."events" TABLESAMPLE BERNOULLI (%s) LIMIT %s' in table_query.text
+    assert table_params == (0.02, 20)
+    assert view_method == foreign_method == "limit"
+    assert "TABLESAMPLE" not in view_query.text
+    assert view_params == (10,)
+
+
+def test_discover_model_imports_declared_constraints(monkeypatch) -> None:
+    def handler(query: str, params):
+        if "information_schema.columns" in query:
+            rows = [
+                ("customer", "id", "integer", "NO"),
+                ("customer", "email", "text", "NO"),
+                ("orders", "id", "integer", "NO"),
+                ("orders", "buyer", "integer", "NO"),
+            ]
+            return ["table_name", "column_name", "data_type", "is_nullable"], rows
+        if "FROM pg_constraint" in query:
+            assert params == ("public", "public")
+            rows = [
+                ("customer", "constraint", "p", "customer_pkey", ["id"], None, None, [], None),
+                ("customer", "constraint", "u", "customer_email_key", ["email"], None, None, [], None),
+                ("customer", "index", "p", "customer_pkey", ["id"], None, None, None, "btree"),
+                ("orders", "constraint", "f", "orders_buyer_fkey", ["buyer"], "public", "customer", ["id"], None),
+                ("orders", "index", "i", "orders_buyer_idx", ["buyer"], None, None, None, "btree"),
+            ]
+            return ["relname"], rows
+        return _orders_catalog_handler(query, params)
+
+    _install_fake_psycopg(monkeypatch, handler)
+
+    model = discovery.discover_model(discovery.PostgresConfig(), mongo=None)
+
+    customer, orders = model.entities
+    assert [(a.name, a.primary_key, a.unique) for a in customer.attributes] == [
+        ("id", True, True),
+        ("email", False, True),
+    ]
+    assert orders.attributes[1].references == "pg:customer.id"
+    assert orders.indexes == [
+        {"name": "orders_buyer_idx", "columns": ["buyer"], "unique": False, "primary": False, "method": "btree"}
+    ]
+    assert [(r.from_field, r.to_entity, r.to_field, r.confidence, r.source) for r in model.relationships] == [
+        ("buyer", "pg:customer", "id", 1.0, "declared")
+    ]
+
+
+def test_declared_fk_to_partitioned_table_points_at_the_parent(monkeypatch) -> None:
+    constraint_queries: list[str] = []
+
+    def handler(query: str, params):
+        if "information_schema.columns" in query:
+            rows = [
+                ("events", "id", "integer", "NO"),
+                ("events_2024_01", "id", "integer", "NO"),
+                ("events_2024_02", "id", "integer", "NO"),
+                ("orders", "event_id", "integer", "NO"),
+            ]
+            return ["table_name", "column_name", "data_type", "is_nullable"], rows
+        if "FROM pg_class" in query:
+            rows = [("events", "p", -1.0, 0, 0, None, None, None, None, None, None, False, None)]
+            rows += [
+                (leaf, "r", 10.0, 1, 1, 10, 1, 0, 0, None, None, True, "events")
+                for leaf in ("events_2024_01", "events_2024_02")
+            ]
+            rows += [("orders", "r", 5.0, 1, 1, 5, 1, 0, 0, None, None, False, None)]
+            return ["relname"], rows
+        if "FROM pg_constraint" in query:
+            constraint_queries.append(query)
+            # Righe come in PostgreSQL 12+: il vincolo padre e un clone per partizione referenziata.
+            rows = [
+                ("orders", "constraint", "f", "orders_event_id_fkey", ["event_id"], "public", "events", ["id"], None),
+                ("orders", "constraint", "f", "orders_event_id_fkey1", ["event_id"], "public", "events_2024_01", ["id"], None),
+                ("orders", "constraint", "f", "orders_event_id_fkey2", ["event_id"], "public", "events_2024_02", ["id"], None),
+            ]
+            return ["relname"], rows
+        return _orders_catalog_handler(query, params)
+
+    _install_fake_psycopg(monkeypatch, handler)
+
+    model = discovery.discover_model(discovery.PostgresConfig(), mongo=None)
+
+    assert "con.conparentid <> 0" in constraint_queries[0]
+    orders = next(e for e in model.entities if e.name == "orders")
+    assert orders.attributes[0].references == "pg:events.id"
+    assert [(r.from_field, r.to_entity, r.source) for r in model.relationships] == [("event_id", "pg:events", "declared")]
+
+
+def test_column_stats_attach_distinct_estimates_and_hide_personal_values() -> None:
+    attributes = [
+        Attribute(name="status", type="text"),
+        Attribute(name="email", type="text"),
+    ]
+    base = {"null_frac": 0.0, "most_common_vals": ["x"], "histogram_min": "a", "histogram_max": "z", "avg_width": 8}
+    stats = {
+        ("orders", "status"): {**base, "n_distinct": 4.0},
+        ("orders", "email"): {**base, "n_distinct": -0.5},
+    }
+
+    discovery._apply_column_stats(attributes, "orders", stats, row_estimate=1000)
+
+    status, email = attributes
+    assert status.stats["distinct_estimate"] == 4
+    assert status.stats["most_common_vals"] == ["x"]
+    assert email.stats["distinct_estimate"] == 500
+    assert email.stats["most_common_vals"] == []
+    assert email.stats["histogram_min"] is None
+
+
+def test_incremental_postgres_discovery_reprofiles_only_changed_tables(monkeypatch, tmp_path) -> None:
+    from datamodel_navigator.io_utils import save_model
+
+    inserts = {"a_orders": 10, "b_items": 20, "c_users": 30}
+    executed: list[str] = []
+
+    def handler(query: str, params):
+        executed.append(query)
+        if "FROM pg_class" in query:
+            rows = [(t, "r", 39.0, 1, 1, 39, n, 0, 0, None, None) for t, n in inserts.items()]
+            return ["relname"], rows
+        return _orders_catalog_handler(query, params)
+
+    _install_fake_psycopg(monkeypatch, handler)
+    model_path = tmp_path / "model.json"
+    config = discovery.PostgresConfig(incremental=True, previous_model_path=str(model_path))
+
+    save_model(discovery.discover_model(config, mongo=None), model_path)
+    inserts["b_items"] += 5
+    executed.clear()
+    model = discovery.discover_model(config, mongo=None)
+
+    profiled = [q for q in executed if q.startswith("SELECT COUNT(*)")]
+    assert profiled == ['SELECT COUNT(*) FROM "public"."b_items"']
+    assert [e.profile.get("reused", False) for e in model.entities] == [True, False, True]
+    assert model.metadata["deep_discovery_samples"]["pg:a_orders"] == [{"id": 1, "email": "***"}]
+    assert "postgres.a_orders: 40 record (conteggio esatto)" in model.metadata["discovery_count_log"]
+    assert any("2 tabelle invariate" in step for step in model.metadata["discovery_log"])
+
+
+def test_postgres_fingerprint_changes_with_sample_caps_and_partitioning() -> None:
+    attributes = [Attribute(name="id", type="integer")]
+    infos = [{"n_tup_ins": 10, "n_tup_upd": 0, "n_tup_del": 0}]
+    baseline = discovery._postgres_fingerprint(discovery.PostgresConfig(), attributes, infos)
+
+    for changed in (
+        {"sample_text_max_chars": 64},
+        {"sample_value_max_bytes": 1024},
+        {"sample_column_max_avg_bytes": 512},
+        {"jsonb_inference": False},
+        {"jsonb_max_depth": 2},
+        {"collapse_partitions": False},
+    ):
+        assert discovery._postgres_fingerprint(discovery.PostgresConfig(**changed), attributes, infos) != baseline
+
+
+def test_discover_postgres_collapses_partitions_into_parent(monkeypatch) -> None:
+    leaves = ["events_2024_01", "events_2024_02", "events_2024_03", "events_2024_04"]
+    executed: list[str] = []
+
+    def handler(query: str, params):
+        executed.append(query)
+        if "information_schema.columns" in query:
+            rows = [(table, "id", "integer", "NO") for table in ["events", *leaves, "users"]]
+            return ["table_name", "column_name", "data_type", "is_nullable"], rows
+        if "FROM pg_class" in query:
+            rows = [("events", "p", -1.0, 0, 0, None, None, None, None, None, None, False, None)]
+            rows += [(leaf, "r", 100.0, 1, 1, 100, 1, 0, 0, None, None, True, "events") for leaf in leaves]
+            rows += [("users", "r", 5.0, 1, 1, 5, 1, 0, 0, None, None, False, None)]
+            return ["relname"], rows
+        if query.startswith("SELECT COUNT(*)"):
+            return ["count"], [(100,)]
+        if query.endswith("LIMIT %s"):
+            return ["id"], [(query.split('FROM "public"."')[1].split('"')[0],)] * params[-1]
+        return [], []
+
+    _install_fake_psycopg(monkeypatch, handler)
+
+    entities, counts, samples = discovery.discover_postgres(
+        discovery.PostgresConfig(sample_records=4, partition_sample_count=2)
+    )
+
+    assert [e.name for e in entities] == ["events", "users"]
+    assert counts["events"] == 400
+    assert entities[0].profile["partitions"] == 4
+    assert entities[0].profile["sampled_partitions"] == ["events_2024_01", "events_2024_04"]
+    assert sorted({record["id"] for record in samples["events"]}) == ["events_2024_01", "events_2024_04"]
+    assert len(samples["events"]) == 4
+    assert not any('"events" ' in q or q.endswith('"events"') for q in executed if q.startswith("SELECT"))
+
+
+def test_jsonb_inference_on_partitioned_tables_uses_only_the_picked_partitions(monkeypatch) -> None:
+    leaves = [f"events_2024_{month:02d}" for month in range(1, 13)]
+    jsonb_tables: list[str] = []
+
+    def handler(query: str, params):
+        if "information_schema.columns" in query:
+            rows = [(table, "payload", "jsonb", "YES") for table in ["events", *leaves]]
+            return ["table_name", "column_name", "data_type", "is_nullable"], rows
+        if "FROM pg_class" in query:
+            rows = [("events", "p", -1.0, 0, 0, None, None, None, None, None, None, False, None)]
+            rows += [(leaf, "r", 100.0, 1, 1, 100, 1, 0, 0, None, None, True, "events") for leaf in leaves]
+            return ["relname"], rows
+        if query.startswith("WITH RECURSIVE sampled"):
+            jsonb_tables.append(query.split('FROM "public"."')[1].split('"')[0])
+            return ["path", "json_type", "documents", "sampled"], [("kind", "string", 10, 10)]
+        return _orders_catalog_handler(query, params)
+
+    _install_fake_psycopg(monkeypatch, handler)
+
+    entities, _, _ = discovery.discover_postgres(
+        discovery.PostgresConfig(count_strategy="estimate", sample_records=0, partition_sample_count=2)
+    )
+
+    assert sorted(jsonb_tables) == ["events_2024_01", "events_2024_12"]
+    assert [a.name for a in entities[0].attributes] == ["payload", "payload.kind"]
+
+
+def test_discover_postgres_expands_jsonb_paths_inferred_server_side(monkeypatch) -> None:
+    jsonb_queries: list[tuple[str, tuple]] = []
+
+    def handler(query: str, params):
+        if "information_schema.columns" in query:
+            rows = [("events", "id", "integer", "NO"), ("events", "payload", "jsonb", "YES")]
+            return ["table_name", "column_name", "data_type", "is_nullable"], rows
+        if "FROM pg_class" in query:
+            return ["relname"], [("events", "r", 1_000_000.0, 100, 100, 1_000_000, 1, 0, 0, None, None, False, None)]
+        if query.startswith("WITH RECURSIVE sampled"):
+            jsonb_queries.append((query, params))
+            rows = [
+                ("customer", "object", 10, 10),
+                ("customer.tier", "string", 4, 10),
+                ("items", "array", 10, 10),
+                ("items[].sku", "string", 10, 10),
+            ]
+            return ["path", "json_type", "documents", "sampled"], rows
+        return _orders_catalog_handler(query, params)
+
+    _install_fake_psycopg(monkeypatch, handler)
+
+    entities, _, _ = discovery.discover_postgres(discovery.PostgresConfig(count_strategy="estimate"))
+
+    names = [a.name for a in entities[0].attributes]
+    assert names == ["id", "payload", "payload.customer", "payload.customer.tier", "payload.items", "payload.items[].sku"]
+    tier = entities[0].attributes[3]
+    assert (tier.type, tier.nullable, tier.stats["presence_ratio"]) == ("string", True, 0.4)
+    query, params = jsonb_queries[0]
+    assert 'SELECT row_number() OVER () AS doc_id, "payload" AS doc FROM "public"."events" TABLESAMPLE SYSTEM (%s)' in query
+    assert params == (0.2, 1000, 4)
+
+    without_samples, _, samples = discovery.discover_postgres(
+        discovery.PostgresConfig(count_strategy="estimate", sample_records=0)
+    )
+    assert [a.name for a in without_samples[0].attributes] == names
+    assert samples["events"] == []
+
+
+def test_sample_projection_caps_payload_per_column() -> None:
+    import types
+
+    sql = types.SimpleNamespace(SQL=_FakeComposed, Identifier=_FakeIdentifier, Literal=_FakeLiteral)
+    config = discovery.PostgresConfig(sample_text_max_chars=100, sample_value_max_bytes=2048, sample_column_max_avg_bytes=500)
+    attributes = [
+        Attribute(name="id", type="integer"),
+        Attribute(name="note", type="text"),
+        Attribute(name="scan", type="bytea"),
+        Attribute(name="payload", type="jsonb"),
+        Attribute(name="dump", type="text", stats={"avg_width": 90_000}),
+    ]
+
+    projection, skipped = discovery._sample_projection(sql, config, attributes)
+
+    assert skipped == ["dump"]
+    assert projection.text == (
+        '"id", left("note", 100) AS "note", '
+        "'<bytea ' || octet_length(\"scan\") || ' bytes>' AS \"scan\", "
+        'CASE WHEN pg_column_size("payload") > 2048 '
+        "THEN jsonb_build_object('truncated_bytes', pg_column_size(\"payload\")) ELSE \"payload\"::jsonb END AS \"payload\""
+    )
+
+
+def test_reservoir_sample_keeps_bounded_uniform_subset() -> None:
+    import random
+
+    sample = discovery._reservoir_sample(iter(range(10_000)), 50, random.Random(7))
+
+    assert len(sample) == 50
+    assert len(set(sample)) == 50
+    assert max(sample) > 5_000
+
+
+class _FakeMongoCollection:
+    def __init__(self, docs: list[dict], stored_count: int | None = None, indexes: list[dict] | None = None) -> None:
+        self.docs = docs
+        self.stored_count = len(docs) if stored_count is None else stored_count
+        self.indexes = [{"name": "_id_", "key": {"_id": 1}}, *(indexes or [])]
+        self.pipelines: list[list[dict]] = []
+        self.exact_counts = 0
+        self.probes: list[dict] = []
+
+    def aggregate(self, pipeline: list[dict]):
+        if "$collStats" in pipeline[0]:
+            return iter([{"storageStats": {"count": self.stored_count, "size": 100, "indexSizes": {"_id_": 10}}}])
+        self.pipelines.append(pipeline)
+        size = pipeline[0]["$sample"]["size"]
+        return iter(self.docs[:size])
+
+    def list_indexes(self):
+        return iter(self.indexes)
+
+    def count_documents(self, filter: dict) -> int:
+        if "_id" in filter:
+            self.probes.append(filter)
+            return sum(1 for doc in self.docs if doc["_id"] in filter["_id"]["$in"])
+        self.exact_counts += 1
+        return len(self.docs)
+
+    def find(self, *_args, **_kwargs):
+        raise AssertionError("la discovery deve usare $sample, non find()")
+
+
+class _FakeMongoDatabase:
+    def __init__(self, collections: dict[str, _FakeMongoCollection]) -> None:
+        self.collections = collections
+
+    def list_collection_names(self) -> list[str]:
+        return list(self.collections)
+
+    def __getitem__(self, name: str) -> _FakeMongoCollection:
+        return self.collections[name]
+
+
+def _install_fake_pymongo(monkeypatch, databases: dict[str, dict[str, _FakeMongoCollection]]) -> None:
+    import sys
+    import types
+
+    class FakeMongoClient:
+        def __init__(self, _uri: str, **_kwargs) -> None:
+            self.databases = {name: _FakeMongoDatabase(cols) for name, cols in databases.items()}
+
+        def __getitem__(self, name: str) -> _FakeMongoDatabase:
+            return self.databases[name]
+
+        def list_database_names(self) -> list[str]:
+            return list(self.databases)
+
+    monkeypatch.setitem(sys.modules, "pymongo", types.SimpleNamespace(MongoClient=FakeMongoClient))
+
+
+def test_discover_mongo_reads_each_collection_once_with_sample(monkeypatch) -> None:
+    docs = [{"_id": i, "kind": "order", "email": f"user{i}@example.com"} for i in range(10)]
+    orders = _FakeMongoCollection(docs)
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": orders}})
+
+    entities, counts, samples = discovery.discover_mongo(discovery.MongoConfig(sample_size=8, sample_records=3))
+
+    assert [pipeline[0] for pipeline in orders.pipelines] == [{"$sample": {"size": 8}}]
+    assert counts == {"orders": 10}
+    assert [a.name for a in entities[0].attributes] == ["_id", "email", "kind"]
+    assert samples["orders"] == [{"_id": i, "kind": "order", "email": "***"} for i in range(3)]
+
+
+def test_discover_mongo_counts_from_collection_stats_by_default(monkeypatch) -> None:
+    big = _FakeMongoCollection([{"_id": 1}], stored_count=5_000_000)
+    small = _FakeMongoCollection([{"_id": 1}, {"_id": 2}], stored_count=3)
+    _install_fake_pymongo(monkeypatch, {"test": {"events": big, "users": small}})
+
+    model = discovery.discover_model(
+        postgres=None, mongo=discovery.MongoConfig(count_strategy="hybrid", exact_count_threshold=1000)
+    )
+
+    assert big.exact_counts == 0
+    assert small.exact_counts == 1
+    assert model.metadata["discovery_count_log"] == [
+        "mongo.events: 5000000 record (stima da metadati)",
+        "mongo.users: 2 record (conteggio esatto)",
+    ]
+
+
+def test_server_side_profiling_uses_aggregates_for_types_and_nullability(monkeypatch) -> None:
+    class ProfiledCollection(_FakeMongoCollection):
+        def aggregate(self, pipeline):
+            if len(pipeline) > 1 and "$facet" in pipeline[1]:
+                self.pipelines.append(pipeline)
+                return iter(
+                    [
+                        {
+                            "sampled": [{"documents": 4}],
+                            "fields": [
+                                {"_id": {"name": "_id", "type": "objectId"}, "documents": 4},
+                                {"_id": {"name": "coupon", "type": "string"}, "documents": 1},
+                                {"_id": {"name": "total", "type": "double"}, "documents": 3},
+                                {"_id": {"name": "total", "type": "null"}, "documents": 1},
+                            ],
+                        }
+                    ]
+                )
+            return super().aggregate(pipeline)
+
+    orders = ProfiledCollection([{"_id": 1, "total": 9.5}])
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": orders}})
+
+    entities, _, samples = discovery.discover_mongo(
+        discovery.MongoConfig(sample_size=1000, sample_records=5, server_side_profiling=True)
+    )
+
+    attributes = {a.name: a for a in entities[0].attributes}
+    assert (attributes["_id"].type, attributes["_id"].nullable) == ("ObjectId", False)
+    assert (attributes["coupon"].type, attributes["coupon"].nullable) == ("str", True)
+    assert attributes["coupon"].stats["presence_ratio"] == 0.25
+    assert (attributes["total"].type, attributes["total"].nullable) == ("float", True)
+    assert orders.pipelines[0][0] == {"$sample": {"size": 1000}}
+    assert orders.pipelines[1][0] == {"$sample": {"size": 5}}
+    assert samples["orders"] == [{"_id": 1, "total": 9.5}]
+
+
+def test_discover_mongo_covers_all_databases_concurrently_in_stable_order(monkeypatch) -> None:
+    databases = {
+        "sales": {"orders": _FakeMongoCollection([{"_id": 1, "total": 3}]), "carts": _FakeMongoCollection([{"_id": 2}])},
+        "admin": {"system.users": _FakeMongoCollection([{"_id": 3}])},
+        "crm": {"leads": _FakeMongoCollection([{"_id": 4, "source": "web"}])},
+    }
+    _install_fake_pymongo(monkeypatch, databases)
+
+    entities, counts, samples = discovery.discover_mongo(discovery.MongoConfig(all_databases=True, concurrency=4))
+
+    assert [e.id for e in entities] == ["mg:crm.leads", "mg:sales.carts", "mg:sales.orders"]
+    assert counts == {"crm.leads": 1, "sales.carts": 1, "sales.orders": 1}
+    assert samples["sales.orders"] == [{"_id": 1, "total": 3}]
+    assert all("profile_seconds" in e.profile for e in entities)
+
+
+def test_mongo_samples_are_capped_and_binary_is_stubbed(monkeypatch) -> None:
+    docs = [{"_id": 1, "scan": b"\x00" * 5000, "note": "x" * 50, "items": [{"tags": list(range(10))}] * 6}]
+    orders = _FakeMongoCollection(docs)
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": orders}})
+
+    entities, _, samples = discovery.discover_mongo(
+        discovery.MongoConfig(sample_records=1, sample_max_array_items=3, sample_max_string_length=10)
+    )
+
+    stage = orders.pipelines[0][1]["$replaceRoot"]["newRoot"]["$arrayToObject"]["$map"]["in"]["v"]
+    operators = [next(iter(branch["then"])) for branch in stage["$switch"]["branches"]]
+    assert operators == ["$substrCP", "$concat"]
+    sample = samples["orders"][0]
+    assert sample["scan"] == "<binData 5000 bytes>"
+    assert sample["note"] == "x" * 10
+    assert sample["items"] == [{"tags": [0, 1, 2]}] * 3
+    attributes = {a.name: a for a in entities[0].attributes}
+    assert attributes["scan"].type == "bytes"
+    # Lo schema vede gli array interi: i limiti valgono solo per i campioni.
+    assert attributes["items"].stats["array_length"] == {"min": 6, "max": 6, "avg": 6.0}
+    assert attributes["items[].tags"].stats["array_length"]["max"] == 10
+
+
+def test_mongo_schema_keeps_binaries_and_late_array_items_when_samples_drop_them(monkeypatch) -> None:
+    docs = [{"_id": 1, "scan": b"\x00" * 10, "items": [{"sku": "A"}] * 3 + [{"sku": "B", "gift": True}]}]
+    orders = _FakeMongoCollection(docs)
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": orders}})
+
+    entities, _, samples = discovery.discover_mongo(
+        discovery.MongoConfig(sample_records=1, sample_max_array_items=2, sample_binary="drop")
+    )
+
+    names = {a.name: a.type for a in entities[0].attributes}
+    assert names["scan"] == "bytes"
+    assert "items[].gift" in names
+    assert samples["orders"] == [{"_id": 1, "items": [{"sku": "A"}] * 2}]
+
+
+def test_mongo_sample_binary_drop_filters_fields() -> None:
+    config = discovery.MongoConfig(sample_binary="drop")
+
+    fields = discovery._mongo_sample_projection(config)[0]["$replaceRoot"]["newRoot"]["$arrayToObject"]["$map"]["input"]
+
+    assert fields["$filter"]["cond"] == {"$ne": [{"$type": "$$field.v"}, "binData"]}
+    assert discovery._cap_mongo_value({"a": b"xx", "b": 1, "c": "<binData 2 bytes>"}, config) == {"b": 1}
+    # Il flusso di schema conserva i binari come stub: il drop avviene solo sui campioni.
+    schema_stage = discovery._mongo_sample_projection(config, schema_stream=True)[0]
+    assert schema_stage["$replaceRoot"]["newRoot"]["$arrayToObject"]["$map"]["input"] == {"$objectToArray": "$$ROOT"}
+
+
+def test_incremental_mongo_discovery_reuses_unchanged_collections(monkeypatch, tmp_path) -> None:
+    from datamodel_navigator.curation import auto_cleanup
+    from datamodel_navigator.io_utils import save_model
+
+    orders = _FakeMongoCollection([{"_id": 1, "total": 3, "updated_at": "2024-01-01"}], stored_count=1)
+    carts = _FakeMongoCollection([{"_id": 2}], stored_count=1)
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": orders, "carts": carts}})
+    model_path = tmp_path / "model.json"
+    config = discovery.MongoConfig(incremental=True, previous_model_path=str(model_path))
+
+    # Come `dmn --phase configure`: i campi tecnici rimossi non invalidano il fingerprint.
+    previous = discovery.discover_model(postgres=None, mongo=config)
+    auto_cleanup(previous)
+    save_model(previous, model_path)
+    carts.docs.append({"_id": 3, "coupon": "X"})
+    carts.stored_count = 2
+    orders.pipelines.clear()
+    carts.pipelines.clear()
+    model = discovery.discover_model(postgres=None, mongo=config)
+
+    assert orders.pipelines == []
+    assert len(carts.pipelines) == 1
+    assert [e.profile.get("reused", False) for e in model.entities] == [False, True]
+    assert model.metadata["deep_discovery_samples"]["mg:orders"] == [{"_id": 1, "total": 3, "updated_at": "2024-01-01"}]
+    assert "coupon" in [a.name for a in model.entities[0].attributes]
+    assert any("1 collection invariate" in step for step in model.metadata["discovery_log"])
+
+
+def test_discover_mongo_stores_indexes_and_marks_keys(monkeypatch) -> None:
+    orders = _FakeMongoCollection(
+        [{"_id": 1, "customer_id": 7, "code": "A", "loc": [0, 0]}],
+        indexes=[
+            {"name": "customer_id_1_code_-1", "key": {"customer_id": 1, "code": -1}},
+            {"name": "code_1", "key": {"code": 1}, "unique": True},
+            {"name": "loc_2dsphere", "key": {"loc": "2dsphere"}, "sparse": True},
+        ],
+    )
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": orders}})
+
+    entities, _, _ = discovery.discover_mongo(discovery.MongoConfig())
+
+    entity = entities[0]
+    assert [(i["name"], i["columns"], i["unique"], i["method"]) for i in entity.indexes] == [
+        ("_id_", ["_id"], True, "btree"),
+        ("customer_id_1_code_-1", ["customer_id", "code"], False, "btree"),
+        ("code_1", ["code"], True, "btree"),
+        ("loc_2dsphere", ["loc"], False, "2dsphere"),
+    ]
+    assert entity.indexes[3]["partial"] is True
+    keys = {a.name: (a.primary_key, a.unique) for a in entity.attributes}
+    assert keys["_id"] == (True, True)
+    assert keys["code"] == (False, True)
+    assert keys["customer_id"] == (False, False)
+
+
+class ObjectId(str):
+    """Sostituto di bson.ObjectId: il rilevatore riconosce il tipo per nome."""
+
+
+def test_discover_model_detects_object_id_references_by_probing_ids(monkeypatch) -> None:
+    buyers = [ObjectId(f"b{i}") for i in range(4)]
+    customers = _FakeMongoCollection([{"_id": oid, "name": "x"} for oid in buyers[:3]])
+    orders = _FakeMongoCollection(
+        [{"_id": ObjectId(f"o{i}"), "buyer": buyers[i], "meta": {"source": ObjectId(f"z{i}")}} for i in range(4)]
+    )
+    counters = _FakeMongoCollection([{"_id": i, "value": i} for i in range(4)])
+    _install_fake_pymongo(monkeypatch, {"test": {"counters": counters, "customers": customers, "orders": orders}})
+
+    model = discovery.discover_model(postgres=None, mongo=discovery.MongoConfig(reference_probe_concurrency=4))
+
+    buyer = next(a for a in model.entities[2].attributes if a.name == "buyer")
+    assert buyer.references == "mg:customers._id"
+    assert buyer.stats["reference_hit_ratio"] == 0.75
+    # Un $in per campo ObjectId (buyer, meta.source) e collection candidata; `counters` ha `_id` intero.
+    assert counters.probes == []
+    assert sorted(len(probe["_id"]["$in"]) for probe in customers.probes + orders.probes) == [4, 4, 4, 4]
+    assert [(r.from_field, r.to_entity, r.to_field, r.confidence, r.source) for r in model.relationships] == [
+        ("buyer", "mg:customers", "_id", 0.75, "detected")
+    ]
+
+
+def test_discover_mongo_emits_structural_variants(monkeypatch) -> None:
+    docs = [{"_id": i, "type": "click", "x": 1} for i in range(6)] + [
+        {"_id": 10 + i, "type": "view", "page": "/"} for i in range(4)
+    ]
+    _install_fake_pymongo(monkeypatch, {"test": {"events": _FakeMongoCollection(docs)}})
+
+    entities, _, _ = discovery.discover_mongo(discovery.MongoConfig())
+
+    events = entities[0]
+    assert events.profile["discriminator"] == "type"
+    assert [(v["value"], v["frequency"]) for v in events.variants] == [("click", 0.6), ("view", 0.4)]
+
+
+def test_discover_model_runs_sources_concurrently_with_deadline(monkeypatch) -> None:
+    import threading
+
+    both_started = threading.Barrier(2, timeout=5)
+
+    def fake_postgres(_config, cancel=None):
+        both_started.wait()
+        return [Entity(id="pg:t", name="t", source_system="postgres", source_type="table")], {"t": 1}, {}
+
+    def fake_mongo(_config, cancel=None):
+        both_started.wait()
+        return [Entity(id="mg:c", name="c", source_system="mongo", source_type="collection")], {"c": 2}, {}
+
+    monkeypatch.setattr(discovery, "discover_postgres", fake_postgres)
+    monkeypatch.setattr(discovery, "discover_mongo", fake_mongo)
+
+    model = discovery.discover_model(
+        discovery.PostgresConfig(),
+        discovery.MongoConfig(),
+        options=discovery.DiscoveryOptions(concurrent_sources=True, deadline_seconds=10),
+    )
+
+    assert [e.id for e in model.entities] == ["pg:t", "mg:c"]
+    assert set(model.metadata["discovery_source_seconds"]) == {"postgres", "mongo"}
+    assert any(step.startswith("Tempo discovery MongoDB:") for step in model.metadata["discovery_log"])
+
+
+def test_discover_model_drops_sources_past_the_deadline(monkeypatch) -> None:
+    import threading
+
+    stopped = threading.Event()
+
+    def slow_mongo(_config, cancel=None):
+        # Come discover_mongo: la cancellazione è controllata tra una collection e l'altra.
+        try:
+            while True:
+                discovery._check_cancelled(cancel)
+                cancel.wait(0.01)
+        finally:
+            stopped.set()
+
+    monkeypatch.setattr(discovery, "discover_postgres", lambda _config, cancel=None: ([], {"t": 1}, {}))
+    monkeypatch.setattr(discovery, "discover_mongo", slow_mongo)
+
+    model = discovery.discover_model(
+        discovery.PostgresConfig(),
+        discovery.MongoConfig(),
+        options=discovery.DiscoveryOptions(concurrent_sources=True, deadline_seconds=0.05),
+    )
+
+    assert model.metadata["discovery_timed_out"] == ["mongo"]
+    assert model.metadata["discovery_count_log"] == ["postgres.t: 1 record"]
+    assert stopped.wait(1)
+
+
+def test_serial_discovery_applies_the_deadline_and_skips_later_sources(monkeypatch) -> None:
+    import threading
+
+    started: list[str] = []
+    release = threading.Event()
+
+    def slow_postgres(_config, cancel=None):
+        started.append("postgres")
+        release.wait(5)
+        return [], {}, {}
+
+    def fake_mongo(_config, cancel=None):
+        started.append("mongo")
+        return [], {}, {}
+
+    monkeypatch.setattr(discovery, "discover_postgres", slow_postgres)
+    monkeypatch.setattr(discovery, "discover_mongo", fake_mongo)
+
+    model = discovery.discover_model(
+        discovery.PostgresConfig(),
+        discovery.MongoConfig(),
+        options=discovery.DiscoveryOptions(deadline_seconds=0.05),
+    )
+    release.set()
+
+    assert model.metadata["discovery_timed_out"] == ["postgres", "mongo"]
+    assert started == ["postgres"]
+
+
+def test_discover_postgres_stops_between_tables_when_cancelled(monkeypatch) -> None:
+    import threading
+
+    import pytest
+
+    _install_fake_psycopg(monkeypatch, _orders_catalog_handler)
+    cancel = threading.Event()
+    cancel.set()
+
+    with pytest.raises(discovery.DiscoveryCancelled):
+        discovery.discover_postgres(discovery.PostgresConfig(), cancel=cancel)
+
+
+def test_discover_model_spills_samples_to_sidecar_files(monkeypatch, tmp_path) -> None:
+    from datamodel_navigator.io_utils import save_model
+    from datamodel_navigator.sampling import SampleStore
+
+    docs = [{"_id": i, "note": "x" * 100} for i in range(5)]
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": _FakeMongoCollection(docs)}})
+    config = discovery.MongoConfig(
+        sample_memory_budget_mb=0.0001,
+        sample_spill_dir=str(tmp_path / "samples"),
+        incremental=True,
+        previous_model_path=str(tmp_path / "model.json"),
+    )
+
+    model = discovery.discover_model(postgres=None, mongo=config)
+    save_model(model, tmp_path / "model.json")
+    again = discovery.discover_model(postgres=None, mongo=config)
+
+    assert "deep_discovery_samples" not in model.metadata
+    path = model.metadata["deep_discovery_sample_files"]["mg:orders"]
+    assert path.startswith(str(tmp_path / "samples" / "mongo"))
+    assert again.entities[0].profile["reused"] is True
+    assert SampleStore.from_metadata({}, again.metadata["deep_discovery_sample_files"])["mg:orders"] == docs
+
+
+def test_incremental_discovery_reprofiles_entities_whose_sample_files_are_gone(monkeypatch, tmp_path) -> None:
+    import shutil
+
+    from datamodel_navigator.io_utils import save_model
+    from datamodel_navigator.sampling import SampleStore
+
+    docs = [{"_id": i, "note": "x" * 100} for i in range(5)]
+    orders = _FakeMongoCollection(docs)
+    _install_fake_pymongo(monkeypatch, {"test": {"orders": orders}})
+    config = discovery.MongoConfig(
+        sample_memory_budget_mb=0.0001,
+        sample_spill_dir=str(tmp_path / "samples"),
+        incremental=True,
+        previous_model_path=str(tmp_path / "model.json"),
+    )
+    save_model(discovery.discover_model(postgres=None, mongo=config), tmp_path / "model.json")
+    shutil.rmtree(tmp_path / "samples")
+    orders.pipelines.clear()
+
+    again = discovery.discover_model(postgres=None, mongo=config)
+
+    assert "reused" not in again.entities[0].profile
+    assert len(orders.pipelines) == 1
+    assert SampleStore.from_metadata({}, again.metadata["deep_discovery_sample_files"])["mg:orders"] == docs
+
+
+def test_discover_model_analyzes_entity_samples_concurrently_in_entity_order(monkeypatch) -> None:
+    import threading
+
+    names = ["a", "b", "c", "d"]
+    entities = [Entity(id=f"pg:{n}", name=n, source_system="postgres", source_type="table") for n in names]
+    samples = {n: [{"type": n}] for n in names}
+    monkeypatch.setattr(discovery, "discover_postgres", lambda _config: (entities, {n: 1 for n in names}, samples))
+    monkeypatch.setattr(
+        discovery,
+        "apply_llm_guidance",
+        lambda entities, _cfg: type("R", (), {"instructions": [], "raw_responses": []})(),
+    )
+    in_flight = threading.Barrier(4, timeout=5)
+    limiters = set()
+
+    def fake_analyze(**kwargs):
+        limiters.add(id(kwargs["limiter"]))
+        in_flight.wait()
+        return [f"insight {kwargs['entity_name']}"]
+
+    monkeypatch.setattr(discovery, "analyze_entity_samples", fake_analyze)
+
+    model = discovery.discover_model(
+        postgres=discovery.PostgresConfig(),
+        mongo=None,
+        llm_config=LLMConfig(user_prompt="varianti", sample_concurrency=4, requests_per_minute=100),
+    )
+
+    assert list(model.metadata["llm_sample_insights"]) == ["pg:a", "pg:b", "pg:c", "pg:d"]
+    assert list(model.metadata["llm_sample_reduction"]) == ["pg:a", "pg:b", "pg:c", "pg:d"]
+    assert len(limiters) == 1
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from datamodel_navigator.sampling import SampleStore
+
+
+def test_sample_store_spills_entities_beyond_the_memory_budget(tmp_path) -> None:
+    store = SampleStore(memory_budget_bytes=200, spill_dir=tmp_path)
+
+    store.put("small", [{"id": 1}])
+    store.put("large", ({"id": i, "payload": "x" * 50} for i in range(10)))
+
+    assert store.in_memory() == {"small": [{"id": 1}]}
+    assert list(store.spilled()) == ["large"]
+    assert store.memory_bytes == len('{"id": 1}')
+    assert store["large"][9] == {"id": 9, "payload": "x" * 50}
+    assert len(store) == 2
+
+
+def test_sample_store_adopts_other_stores_without_reading_files(tmp_path) -> None:
+    source = SampleStore(memory_budget_bytes=0, spill_dir=tmp_path)
+    source.put("orders", [{"id": 1}])
+    combined = SampleStore()
+
+    combined.adopt(source, prefix="mg:")
+    combined.adopt({"users": [{"id": 2}]}, prefix="pg:")
+
+    assert combined.spilled() == {"mg:orders": source.spilled()["orders"]}
+    assert combined["mg:orders"] == [{"id": 1}]
+    assert combined.get("pg:users") == [{"id": 2}]
+    restored = SampleStore.from_metadata(combined.in_memory(), combined.spilled())
+    assert dict(restored) == {"pg:users": [{"id": 2}], "mg:orders": [{"id": 1}]}
+
+
+def test_sample_store_treats_missing_sidecar_files_as_absent(tmp_path) -> None:
+    store = SampleStore(memory_budget_bytes=0, spill_dir=tmp_path)
+    store.put("orders", [{"id": 1}])
+    path = store.spilled()["orders"]
+    restored = SampleStore.from_metadata({}, {"orders": path, "users": str(tmp_path / "gone.jsonl")})
+
+    assert list(restored) == ["orders"]
+    Path(path).unlink()
+    assert restored.get("orders") is None
+    assert "users" not in restored
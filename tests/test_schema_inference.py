@@ -0,0 +1,80 @@
+from datamodel_navigator.anonymization import Anonymizer
+from datamodel_navigator.schema_inference import SchemaTrie, ShapeClusterer
+
+
+def test_schema_trie_infers_nested_paths_with_presence_and_array_stats() -> None:
+    trie = SchemaTrie()
+    trie.add({"_id": 1, "address": {"city": "Roma"}, "items": [{"sku": "a"}, {"sku": "b", "qty": 2}]})
+    trie.add({"_id": 2, "address": None, "items": []})
+
+    attributes = {attr.name: attr for attr in trie.attributes(source="mongo")}
+
+    assert sorted(attributes) == ["_id", "address", "address.city", "items", "items[]", "items[].qty", "items[].sku"]
+    assert attributes["address"].type == "dict"
+    assert attributes["address"].nullable is True
+    assert attributes["address.city"].stats["presence_ratio"] == 0.5
+    assert attributes["items[].sku"].stats["presence_ratio"] == 0.5
+    assert attributes["items"].stats["array_length"] == {"min": 0, "max": 2, "avg": 1.0}
+    assert attributes["_id"].nullable is False
+    assert attributes["_id"].source == "mongo"
+
+
+def test_schema_trie_memory_does_not_grow_with_documents() -> None:
+    trie = SchemaTrie(max_depth=2)
+    for i in range(20_000):
+        trie.add({"_id": i, "deep": {"level": {"ignored": i}}, "tags": [str(i)] * 3})
+
+    attributes = trie.attributes()
+
+    assert [attr.name for attr in attributes] == ["_id", "deep", "deep.level", "tags", "tags[]"]
+    assert attributes[4].stats["types"] == {"str": 60_000}
+    assert trie.documents == 20_000
+
+
+def test_shape_clusterer_detects_discriminator_and_variants() -> None:
+    shapes = ShapeClusterer()
+    for i in range(60):
+        shapes.add({"_id": i, "kind": "card", "status": "ok" if i % 2 else "ko", "pan": "x", "expiry": "12/30"})
+    for i in range(40):
+        payment = {"_id": i, "kind": "iban", "status": "ok" if i % 2 else "ko", "iban": "IT00"}
+        if i % 4 == 0:
+            payment["bic"] = "B"
+        shapes.add(payment)
+
+    variants = shapes.variants()
+
+    assert shapes.discriminator() == "kind"
+    assert [(v["value"], v["documents"], v["frequency"]) for v in variants] == [("card", 60, 0.6), ("iban", 40, 0.4)]
+    iban = {a["name"]: a["presence_ratio"] for a in variants[1]["attributes"]}
+    assert iban == {"_id": 1.0, "bic": 0.25, "iban": 1.0, "kind": 1.0, "status": 1.0}
+
+
+def test_shape_clusterer_falls_back_to_signatures_without_discriminator() -> None:
+    shapes = ShapeClusterer()
+    for i in range(100_000):
+        document = {"_id": i, "name": str(i)}
+        if i % 10 == 0:
+            document["note"] = "n"
+        shapes.add(document)
+
+    variants = shapes.variants()
+
+    assert shapes.discriminator() == ""
+    assert [(v["documents"], [a["name"] for a in v["attributes"]]) for v in variants] == [
+        (90_000, ["_id", "name"]),
+        (10_000, ["_id", "name", "note"]),
+    ]
+    assert "discriminator" not in variants[0]
+
+
+def test_shape_clusterer_never_exposes_personal_values_as_discriminator() -> None:
+    shapes = ShapeClusterer(anonymizer=Anonymizer(value_patterns=(r"@",)))
+    for i in range(10):
+        shapes.add({"_id": i, "customer_name": "Mario Rossi", "contact": "mario@example.com", "vip": True})
+        shapes.add({"_id": i, "customer_name": "Anna Bianchi", "contact": "anna@example.com"})
+
+    variants = shapes.variants()
+
+    assert shapes.discriminator() == ""
+    assert len(variants) == 2
+    assert all("value" not in variant for variant in variants)